@@ -0,0 +1,138 @@
+import os
+import json
+import zlib
+import struct
+import tempfile
+import numpy as np
+from django.conf import settings
+from langchain.vectorstores import FAISS
+from repo.models import Content
+from .locks import index_build_lock
+from .snapshots import current_snapshot, publish_snapshot
+from .utils import (
+    get_embeddings_dimension, get_embeddings_model, get_embeddings_model_key, load_vector_store, save_vector_store
+)
+
+MAGIC = b'ASKB'
+FORMAT_VERSION = 1
+# magic, format version, compressed header length
+PREAMBLE = struct.Struct('<4sHI')
+VECTOR_DTYPES = ('float16', 'float32')
+
+class BundleError(Exception):
+    """A knowledge-base bundle is unreadable or doesn't match this deployment"""
+
+def export_bundle(user, path, float16=False):
+    """Write a user's current index (chunks, vectors, content ids) to a single bundle file"""
+    version, snapshot_path = current_snapshot(user.id)
+    if version is None:
+        raise BundleError(f"User {user.username} has no index to export")
+    vector_store = load_vector_store(user.id, version, snapshot_path)
+    if vector_store is None:
+        raise BundleError(f"The index for user {user.username} could not be loaded")
+
+    count = vector_store.index.ntotal
+    vectors = vector_store.index.reconstruct_n(0, count) if count else np.zeros((0, vector_store.index.d))
+    vectors = np.ascontiguousarray(vectors, dtype=np.float16 if float16 else np.float32)
+
+    chunks = [
+        vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+        for i in range(count)
+    ]
+
+    header = {
+        "model": get_embeddings_model_key(),
+        "dim": int(vector_store.index.d),
+        "dtype": str(vectors.dtype),
+        "count": count,
+        "content_ids": vector_store.content_ids.tolist(),
+        "chunks": chunks,
+    }
+    header_bytes = zlib.compress(json.dumps(header).encode('utf-8'), 9)
+
+    # Write next to the destination and rename, so a partial bundle is never left behind
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            file.write(header_bytes)
+            file.write(vectors.tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+    return count
+
+def read_bundle(path):
+    """Read and validate a bundle file, returning (header, float32 vectors)"""
+    with open(path, 'rb') as file:
+        preamble = file.read(PREAMBLE.size)
+        if len(preamble) != PREAMBLE.size:
+            raise BundleError("File is too short to be a knowledge-base bundle")
+        magic, format_version, header_length = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise BundleError("Not a knowledge-base bundle")
+        if format_version != FORMAT_VERSION:
+            raise BundleError(f"Unsupported bundle format version {format_version}")
+        try:
+            header = json.loads(zlib.decompress(file.read(header_length)).decode('utf-8'))
+        except (zlib.error, UnicodeDecodeError, ValueError):
+            raise BundleError("Bundle header is corrupt")
+        data = file.read()
+
+    check_header(header)
+    vectors = np.frombuffer(data, dtype=np.dtype(header["dtype"]))
+    if vectors.size != header["count"] * header["dim"]:
+        raise BundleError("Bundle vectors are truncated or corrupt")
+    return header, vectors.reshape(header["count"], header["dim"]).astype(np.float32)
+
+def check_header(header):
+    """Reject headers whose chunks, content ids and vectors don't line up one to one"""
+    if not isinstance(header, dict):
+        raise BundleError("Bundle header is corrupt")
+    missing = [key for key in ("model", "dim", "dtype", "count", "content_ids", "chunks") if key not in header]
+    if missing:
+        raise BundleError(f"Bundle header is missing {', '.join(missing)}")
+    count, dim = header["count"], header["dim"]
+    if not isinstance(count, int) or count < 0 or not isinstance(dim, int) or dim <= 0:
+        raise BundleError("Bundle header has an invalid count or dimension")
+    if header["dtype"] not in VECTOR_DTYPES:
+        raise BundleError(f"Unsupported vector type {header['dtype']}")
+    chunks, content_ids = header["chunks"], header["content_ids"]
+    if not isinstance(chunks, list) or not all(isinstance(chunk, str) for chunk in chunks):
+        raise BundleError("Bundle chunks must be a list of strings")
+    if not isinstance(content_ids, list) or not all(isinstance(cid, int) for cid in content_ids):
+        raise BundleError("Bundle content ids must be a list of integers")
+    if not len(chunks) == len(content_ids) == count:
+        raise BundleError(
+            f"Bundle has {len(chunks)} chunks and {len(content_ids)} content ids for {count} vectors"
+        )
+
+def import_bundle(user, path):
+    """Load a bundle into a ready index for user, without any embedding calls.
+
+    Returns (chunk count, content ids in the bundle that don't belong to user).
+    """
+    header, vectors = read_bundle(path)
+    model_key = get_embeddings_model_key()
+    if header["model"] != model_key:
+        raise BundleError(
+            f"Bundle was embedded with {header['model']} but this deployment uses {model_key}"
+        )
+    if not header["count"]:
+        raise BundleError("Bundle is empty")
+    dimension = get_embeddings_dimension()
+    if dimension is not None and header["dim"] != dimension:
+        raise BundleError(f"Bundle vectors have {header['dim']} dimensions but {model_key} produces {dimension}")
+
+    known_ids = set(Content.objects.filter(user=user).values_list('id', flat=True))
+    missing_ids = sorted({cid for cid in header["content_ids"] if cid not in known_ids})
+
+    vector_store = FAISS.from_embeddings(
+        text_embeddings=list(zip(header["chunks"], vectors)),
+        embedding=get_embeddings_model()
+    )
+    vector_store.content_ids = np.asarray(header["content_ids"], dtype=np.int64)
+    with index_build_lock(user.id, settings.INDEX_BUILD_LOCK_TIMEOUT):
+        publish_snapshot(user.id, lambda snapshot_path: save_vector_store(vector_store, snapshot_path))
+    return header["count"], missing_ids
@@ -0,0 +1,170 @@
+import re
+from django.conf import settings
+
+# Markdown headings, or short ALL CAPS lines such as "WEEK 3: RECURSION"
+HEADING_RE = re.compile(r"^(#{1,6}\s+\S.*|(?=.*[A-Z])[A-Z0-9][A-Z0-9 \t:,&()'/-]{2,80})$")
+UNDERLINE_RE = re.compile(r'^(=+|-+)$')
+SENTENCE_END_RE = re.compile(r'(?<=[.!?])\s+')
+MAX_HEADING_LENGTH = 100
+# Oversized paragraphs are never cut into pieces shorter than this
+MIN_PIECE_SIZE = 100
+
+class RecursiveChunker:
+    """The original langchain recursive character splitter"""
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.key = f"recursive-{chunk_size}-{chunk_overlap}"
+        self._splitter = None
+
+    def split(self, text):
+        if self._splitter is None:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+            self._splitter = RecursiveCharacterTextSplitter(
+                chunk_size=self.chunk_size,
+                chunk_overlap=self.chunk_overlap,
+                length_function=len
+            )
+        return self._splitter.split_text(text)
+
+class StructuredChunker:
+    """Single-pass splitter that keeps headings with their sections and never cuts paragraphs.
+
+    Lines are grouped into paragraphs at blank lines and a new section starts at
+    each heading. Paragraphs are packed into chunks of up to chunk_size
+    characters, each prefixed with its section heading. The last paragraph of a
+    chunk is repeated at the start of the next when it fits in chunk_overlap.
+    Only paragraphs longer than chunk_size are split, at sentence ends.
+    """
+
+    def __init__(self, chunk_size=1000, chunk_overlap=200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.key = f"structured-{chunk_size}-{chunk_overlap}"
+
+    def _blocks(self, text):
+        # Yield (heading, paragraph) pairs in a single pass over the lines. A heading
+        # with no text under it is yielded as a paragraph of its own so it is still indexed.
+        heading = None
+        heading_used = True
+        paragraph = []
+        previous = None
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                if paragraph:
+                    yield heading, ' '.join(paragraph)
+                    heading_used = True
+                    paragraph = []
+                previous = None
+                continue
+            if (UNDERLINE_RE.match(line) and previous is not None and len(paragraph) == 1
+                    and len(previous) <= MAX_HEADING_LENGTH):
+                # Setext heading: the line above was the heading text
+                paragraph = []
+                new_heading = previous
+            elif not paragraph and HEADING_RE.match(line) and len(line) <= MAX_HEADING_LENGTH:
+                new_heading = line.lstrip('#').strip()
+            else:
+                paragraph.append(line)
+                previous = line
+                continue
+            if not heading_used:
+                yield None, heading
+            heading, heading_used = new_heading, False
+            previous = None
+        if paragraph:
+            yield heading, ' '.join(paragraph)
+            heading_used = True
+        if not heading_used:
+            yield None, heading
+
+    def _pieces(self, paragraph, limit):
+        # Split an oversized paragraph at sentence ends, hard-cutting only runaway sentences
+        limit = max(limit, min(MIN_PIECE_SIZE, self.chunk_size), 1)
+        if len(paragraph) <= limit:
+            yield paragraph
+            return
+        piece = ''
+        for sentence in SENTENCE_END_RE.split(paragraph):
+            while len(sentence) > limit:
+                if piece:
+                    yield piece
+                    piece = ''
+                yield sentence[:limit]
+                sentence = sentence[limit:]
+            if piece and len(piece) + 1 + len(sentence) > limit:
+                yield piece
+                piece = sentence
+            else:
+                piece = f"{piece} {sentence}" if piece else sentence
+        if piece:
+            yield piece
+
+    def split(self, text):
+        chunks = []
+        current = []
+        current_heading = None
+        prefix = 0
+        size = 0
+
+        def flush():
+            if current:
+                body = '\n\n'.join(current)
+                chunks.append(f"{current_heading}\n\n{body}" if prefix else body)
+
+        for heading, paragraph in self._blocks(text):
+            if heading != current_heading:
+                flush()
+                current, size, current_heading = [], 0, heading
+                # Only repeat headings that leave at least half of each chunk for the text;
+                # a longer one is kept once, as the first paragraph of its section
+                prefix = len(heading) + 2 if heading and len(heading) + 2 <= self.chunk_size // 2 else 0
+                if heading and not prefix:
+                    paragraph = f"{heading} {paragraph}"
+            for piece in self._pieces(paragraph, self.chunk_size - prefix):
+                if current and prefix + size + 2 + len(piece) > self.chunk_size:
+                    last = current[-1]
+                    flush()
+                    current, size = [], 0
+                    # Carry a short trailing paragraph over for context
+                    if len(last) <= self.chunk_overlap and prefix + len(last) + 2 + len(piece) <= self.chunk_size:
+                        current, size = [last], len(last)
+                current.append(piece)
+                size += len(piece) + (2 if size else 0)
+        flush()
+        return chunks
+
+class WholeChunker:
+    """Keeps short texts (descriptions of links, images, videos) as a single chunk"""
+
+    def __init__(self, max_size=2000, chunk_size=1000, chunk_overlap=200):
+        self.max_size = max_size
+        self.fallback = StructuredChunker(chunk_size, chunk_overlap)
+        self.key = f"whole-{max_size}-{self.fallback.key}"
+
+    def split(self, text):
+        text = text.strip()
+        if not text:
+            return []
+        if len(text) <= self.max_size:
+            return [text]
+        return self.fallback.split(text)
+
+CHUNKERS = {
+    'recursive': RecursiveChunker,
+    'structured': StructuredChunker,
+    'whole': WholeChunker,
+}
+
+_chunkers = {}
+
+def get_chunker(content_type):
+    """Chunker configured for a Content.content_type in settings.CHUNKING"""
+    chunker = _chunkers.get(content_type)
+    if chunker is None:
+        config = dict(settings.CHUNKING.get(content_type) or settings.CHUNKING['default'])
+        chunker = CHUNKERS[config.pop('chunker')](**config)
+        _chunkers[content_type] = chunker
+    return chunker
@@ -0,0 +1,92 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from langchain.embeddings.base import Embeddings
+from . import metrics
+
+class EmbeddingDispatcher:
+    """Coalesces concurrent embed_query calls into batched embed_documents calls"""
+
+    def __init__(self, embeddings, max_wait_ms=10, max_batch_size=32):
+        self.embeddings = embeddings
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-dispatcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text):
+        """Queue a query and return a future for its embedding"""
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed_query(self, text):
+        """Embed a query, waiting for the batch it lands in"""
+        return self.submit(text).result()
+
+    def _collect(self):
+        # Block for the first request and take everything already queued behind it, so a
+        # backlog built up during the previous call goes out in full batches
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # Then wait for stragglers until the oldest request has waited max_wait
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            for _, _, queued_at in batch:
+                metrics.observe("embedding_dispatch.wait_ms", (started - queued_at) * 1000)
+            metrics.observe("embedding_dispatch.batch_size", len(batch))
+            metrics.increment("embedding_dispatch.batches")
+
+            try:
+                vectors = self.embeddings.embed_documents([text for text, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future, _), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+class DispatchedEmbeddings(Embeddings):
+    """Embeddings wrapper that routes single queries through a shared dispatcher"""
+
+    def __init__(self, embeddings, dispatcher):
+        self.embeddings = embeddings
+        self.dispatcher = dispatcher
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.dispatcher.embed_query(text)
+
+# One dispatcher per embedding provider, shared by all requests in the process
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+def get_dispatcher(key, factory, max_wait_ms, max_batch_size):
+    """Get or start the dispatcher for an embedding provider"""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(key)
+        if dispatcher is None:
+            dispatcher = EmbeddingDispatcher(factory(), max_wait_ms=max_wait_ms, max_batch_size=max_batch_size)
+            _dispatchers[key] = dispatcher
+        return dispatcher
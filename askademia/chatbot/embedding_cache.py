@@ -0,0 +1,87 @@
+import os
+import re
+import json
+import time
+import hashlib
+import tempfile
+import numpy as np
+from django.conf import settings
+
+def text_key(text, chunker_key):
+    """Cache key for a document's text as split by a given chunker"""
+    return hashlib.sha256(f"{chunker_key}\n{text}".encode('utf-8')).hexdigest()
+
+# Written into each index snapshot: the cache entries it was built from
+SNAPSHOT_KEYS_FILE = 'embedding_keys.json'
+
+def get_cache_root():
+    return os.path.join(settings.MEDIA_ROOT, 'embeddings')
+
+class EmbeddingCache:
+    """Chunks and vectors for previously embedded documents, keyed by text hash.
+
+    Entries are namespaced by embedding model and keyed by text and chunker,
+    so a change to either never serves stale vectors. Nothing is evicted on
+    write; prune_embedding_cache removes entries no index snapshot uses.
+    """
+
+    def __init__(self, model_key):
+        namespace = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_key)
+        self.root = os.path.join(get_cache_root(), namespace)
+
+    def _path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.npz")
+
+    def get(self, key):
+        """Return (chunks, vectors) for a document, or None if not cached"""
+        try:
+            with np.load(self._path(key)) as data:
+                return data["chunks"].tolist(), data["vectors"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, chunks, vectors):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write then rename so concurrent builds never read a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            np.savez(file, chunks=np.array(chunks, dtype=str), vectors=np.asarray(vectors, dtype=np.float32))
+        os.replace(tmp_path, path)
+
+def write_snapshot_keys(path, keys):
+    with open(os.path.join(path, SNAPSHOT_KEYS_FILE), 'w', encoding='utf-8') as file:
+        json.dump(sorted(keys), file)
+
+def read_snapshot_keys(path):
+    """Cache keys a snapshot was built from, or None for snapshots that predate key tracking"""
+    try:
+        with open(os.path.join(path, SNAPSHOT_KEYS_FILE), 'r', encoding='utf-8') as file:
+            return set(json.load(file))
+    except FileNotFoundError:
+        return None
+
+def prune_embedding_cache(referenced_keys, min_age_seconds):
+    """Delete cache entries (for any model) not in referenced_keys and untouched for min_age_seconds.
+
+    The age check leaves entries from builds still in progress alone. Returns
+    (entries removed, bytes freed).
+    """
+    cutoff = time.time() - min_age_seconds
+    removed = freed = 0
+    for directory, _, files in os.walk(get_cache_root()):
+        for name in files:
+            key, ext = os.path.splitext(name)
+            if ext == '.npz' and key in referenced_keys:
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
@@ -0,0 +1,119 @@
+import os
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+# Loaded models are shared by every LocalEmbeddings instance in the process
+_models = {}
+_models_lock = threading.Lock()
+
+def load_local_model(model_path):
+    """Load a sentence-transformers model from disk, once per process"""
+    with _models_lock:
+        model = _models.get(model_path)
+        if model is None:
+            if not os.path.isdir(model_path):
+                raise FileNotFoundError(f"Local embedding model not found at {model_path}")
+            # Never reach out to the hub; the model must already be on disk. huggingface_hub
+            # reads these when it is first imported, so they must be set before the import.
+            os.environ["HF_HUB_OFFLINE"] = "1"
+            os.environ["TRANSFORMERS_OFFLINE"] = "1"
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(model_path, device="cpu")
+            _models[model_path] = model
+        return model
+
+# Parallel batch encodes share the cores by lowering torch's process-wide thread count;
+# the original count is restored once the last of them finishes
+_torch_threads_lock = threading.Lock()
+_torch_threads_users = 0
+_torch_threads_saved = None
+
+@contextmanager
+def split_torch_threads(per_worker):
+    """Run parallel encodes with per_worker torch threads each"""
+    global _torch_threads_users, _torch_threads_saved
+    import torch
+    with _torch_threads_lock:
+        if _torch_threads_users == 0:
+            _torch_threads_saved = torch.get_num_threads()
+        _torch_threads_users += 1
+        torch.set_num_threads(per_worker)
+    try:
+        yield
+    finally:
+        with _torch_threads_lock:
+            _torch_threads_users -= 1
+            if _torch_threads_users == 0:
+                torch.set_num_threads(_torch_threads_saved)
+
+def make_batches(texts, max_batch_size, max_batch_chars):
+    """Group text indices into batches of similar length.
+
+    Texts are sorted longest first so each batch pads to a similar length,
+    and a batch is closed once its padded size would exceed max_batch_chars.
+    """
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    batches = []
+    batch = []
+    batch_width = 0
+    for i in order:
+        width = max(batch_width, len(texts[i]), 1)
+        if batch and (len(batch) >= max_batch_size or width * (len(batch) + 1) > max_batch_chars):
+            batches.append(batch)
+            batch = []
+            width = max(len(texts[i]), 1)
+        batch.append(i)
+        batch_width = width
+    if batch:
+        batches.append(batch)
+    return batches
+
+class LocalEmbeddings(Embeddings):
+    """Offline CPU embeddings using a local sentence-transformers model"""
+
+    def __init__(self, model_path, max_batch_size=64, max_batch_chars=32000, num_threads=None):
+        self.model_path = model_path
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.num_threads = num_threads or os.cpu_count() or 1
+
+    def _encode(self, model, texts):
+        return model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        )
+
+    def embed_documents(self, texts):
+        """Embed texts in length-sorted batches spread across a thread pool"""
+        if not texts:
+            return []
+        model = load_local_model(self.model_path)
+        batches = make_batches(texts, self.max_batch_size, self.max_batch_chars)
+        vectors = [None] * len(texts)
+
+        if len(batches) == 1 or self.num_threads == 1:
+            results = [self._encode(model, [texts[i] for i in batch]) for batch in batches]
+        else:
+            # Torch releases the GIL inside its kernels, so split the cores between workers
+            workers = min(self.num_threads, len(batches))
+            with split_torch_threads(max(1, self.num_threads // workers)):
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(
+                        lambda batch: self._encode(model, [texts[i] for i in batch]),
+                        batches
+                    ))
+
+        for batch, embedded in zip(batches, results):
+            for i, vector in zip(batch, embedded):
+                vectors[i] = np.asarray(vector, dtype=np.float32).tolist()
+        return vectors
+
+    def embed_query(self, text):
+        """Embed a single query"""
+        return self.embed_documents([text])[0]
@@ -4,7 +4,7 @@ from .models import ChatbotConfig
 class ChatbotConfigForm(forms.ModelForm):
     class Meta:
         model = ChatbotConfig
-        fields = ['name', 'welcome_message', 'confidence_threshold', 'enable_web_links']
+        fields = ['name', 'welcome_message', 'confidence_threshold', 'enable_web_links', 'early_exit_enabled', 'early_exit_floor']
         widgets = {
             'name': forms.TextInput(attrs={'class': 'form-control'}),
             'welcome_message': forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
@@ -15,4 +15,21 @@ class ChatbotConfigForm(forms.ModelForm):
                 'step': '0.05'
             }),
             'enable_web_links': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        }
\ No newline at end of file
+            'early_exit_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+            'early_exit_floor': forms.NumberInput(attrs={
+                'class': 'form-control',
+                'min': '0.0',
+                'max': '0.9',
+                'step': '0.05'
+            }),
+        }
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        threshold = cleaned_data.get('confidence_threshold')
+        floor = cleaned_data.get('early_exit_floor')
+        # Skipped questions must still be logged as knowledge gaps
+        if threshold is not None and floor is not None and floor > threshold:
+            self.add_error('early_exit_floor', 'The early exit floor cannot be above the confidence threshold.')
+        
+        return cleaned_data
\ No newline at end of file
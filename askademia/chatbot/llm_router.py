@@ -0,0 +1,200 @@
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+class LLMUnavailable(Exception):
+    """No configured LLM provider could answer"""
+
+class CircuitBreaker:
+    """Stops sending traffic to a provider after repeated failures, retrying after a cool-down"""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            # Half-open: let a trial request through once the cool-down has passed
+            return time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class Provider:
+    """One LLM provider with its recent latencies, circuit breaker and pool of call threads.
+
+    At most max_in_flight calls run at once; submit refuses further calls rather
+    than queueing them, so a hanging provider can't pile up threads.
+    """
+
+    def __init__(self, name, client_factory, breaker, max_in_flight=32):
+        self.name = name
+        self.client_factory = client_factory
+        self.breaker = breaker
+        self.latencies = deque(maxlen=200)
+        self._client = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"llm-{name}")
+        self._expired = set()
+        self._outcome_lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory(self.name)
+            return self._client
+
+    def latency_percentile(self, percentile):
+        ordered = sorted(self.latencies)
+        if not ordered:
+            return None
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
+    def call(self, prompt):
+        started = time.monotonic()
+        try:
+            result = self.client.predict(prompt)
+        except Exception:
+            metrics.increment(f"llm.errors.{self.name}")
+            raise
+        elapsed = time.monotonic() - started
+        self.latencies.append(elapsed)
+        metrics.observe(f"llm.latency_ms.{self.name}", elapsed * 1000)
+        return result
+
+    def submit(self, prompt):
+        """Start a call and return its future, or None if max_in_flight calls are already running"""
+        if not self._slots.acquire(blocking=False):
+            metrics.increment(f"llm.saturated.{self.name}")
+            return None
+        future = self._executor.submit(self.call, prompt)
+        future.add_done_callback(self._finished)
+        return future
+
+    def expire(self, future):
+        """Count a call still running at the router's deadline as a failure"""
+        with self._outcome_lock:
+            if future.done():
+                return
+            self._expired.add(future)
+            self.breaker.record_failure()
+        metrics.increment(f"llm.timeouts.{self.name}")
+
+    def _finished(self, future):
+        self._slots.release()
+        with self._outcome_lock:
+            if future in self._expired:
+                # Already counted as a timeout; a late answer shouldn't close the breaker again
+                self._expired.discard(future)
+            elif future.exception() is None:
+                self.breaker.record_success()
+            else:
+                self.breaker.record_failure()
+
+class LLMRouter:
+    """Sends prompts to the first healthy provider, hedging and failing over to the rest.
+
+    If the primary hasn't answered by its latency percentile, the same prompt is
+    also sent to the next provider and whichever answers first wins. Errors
+    move on to the next provider immediately. Providers with an open breaker or
+    with all their call slots busy are skipped, and calls still running when the
+    timeout passes count against their provider's breaker.
+    """
+
+    def __init__(self, providers, hedge_percentile=95, hedge_min_samples=20, timeout=60):
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.timeout = timeout
+
+    def hedge_delay(self, provider):
+        if len(provider.latencies) < self.hedge_min_samples:
+            return None
+        return provider.latency_percentile(self.hedge_percentile)
+
+    def invoke(self, prompt):
+        """Return (answer, provider name)"""
+        candidates = [provider for provider in self.providers if provider.breaker.allow()]
+        if not candidates:
+            raise LLMUnavailable("All LLM providers are failing")
+
+        metrics.increment("llm.requests")
+        pending = {}
+        next_index = 0
+        hedged = False
+
+        def launch():
+            """Start the next candidate with a free slot, returning it or None if none are left"""
+            nonlocal next_index
+            while next_index < len(candidates):
+                provider = candidates[next_index]
+                next_index += 1
+                future = provider.submit(prompt)
+                if future is not None:
+                    pending[future] = provider
+                    return provider
+            return None
+
+        primary = launch()
+        if primary is None:
+            metrics.increment("llm.unavailable")
+            raise LLMUnavailable("All LLM providers are busy")
+        primary_started = time.monotonic()
+        deadline = primary_started + self.timeout
+        last_error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = remaining
+            hedge_delay = self.hedge_delay(primary)
+            if not hedged and next_index < len(candidates) and hedge_delay is not None:
+                wait_for = min(remaining, max(0.0, hedge_delay - (time.monotonic() - primary_started)))
+
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            if not done:
+                if not hedged and next_index < len(candidates):
+                    hedged = True
+                    metrics.increment("llm.hedged")
+                    launch()
+                continue
+
+            for future in done:
+                provider = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    last_error = e
+                    logger.warning("LLM provider %s failed: %s", provider.name, e)
+                    continue
+                metrics.increment(f"llm.answered.{provider.name}")
+                return result, provider.name
+
+            if not pending and next_index < len(candidates):
+                metrics.increment("llm.failover")
+                launch()
+
+        for future, provider in pending.items():
+            provider.expire(future)
+        metrics.increment("llm.unavailable")
+        raise LLMUnavailable("No LLM provider answered in time") from last_error
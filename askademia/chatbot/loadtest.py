@@ -0,0 +1,137 @@
+import json
+import time
+import random
+import asyncio
+from urllib.parse import urlsplit
+
+DEFAULT_QUESTIONS = [
+    "When is the final exam?",
+    "Can you summarise the lecture on recursion?",
+    "What topics are covered in week 3?",
+    "How is the coursework weighted?",
+    "Where can I find the lab instructions?",
+    "What is the late submission policy?",
+    "Explain the difference between a list and a tuple.",
+    "Which chapters should I revise for the midterm?",
+]
+
+class EndpointStats:
+    """Latencies and errors (connection failures and any non-2xx response) for one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.statuses = {}
+
+    def record(self, status, latency):
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if not 200 <= status < 300:
+            self.errors += 1
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+        return ordered[index]
+
+    def summary(self, elapsed):
+        count = len(self.latencies)
+        return {
+            'requests': count,
+            'throughput_rps': count / elapsed if elapsed else 0.0,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'p99_ms': self.percentile(99) * 1000,
+            'error_rate': self.errors / count if count else 0.0,
+            'statuses': self.statuses,
+        }
+
+async def http_request(base_url, method, path, body=None, timeout=60):
+    """Minimal HTTP/1.1 client on asyncio streams; returns (status, body bytes)"""
+    url = urlsplit(base_url)
+    host = url.hostname
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    reader, writer = await asyncio.wait_for(
+        asyncio.open_connection(host, port, ssl=url.scheme == 'https'), timeout
+    )
+    try:
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        headers = [
+            f"{method} {url.path.rstrip('/')}{path} HTTP/1.1",
+            f"Host: {url.netloc}",
+            "Connection: close",
+            f"Content-Length: {len(payload)}",
+        ]
+        if body is not None:
+            headers.append("Content-Type: application/json")
+        writer.write(("\r\n".join(headers) + "\r\n\r\n").encode('latin-1') + payload)
+        await writer.drain()
+
+        response = await asyncio.wait_for(reader.read(), timeout)
+        head, _, content = response.partition(b"\r\n\r\n")
+        status = int(head.split(b" ", 2)[1])
+        return status, content
+    finally:
+        writer.close()
+
+class LoadTest:
+    """Drives chat_api and the widget endpoints with simulated visitor sessions.
+
+    Each virtual user loads the widget (HTML and script), opens a new widget
+    session with its first question, then continues that session_id for a few
+    more turns with think time in between.
+    """
+
+    def __init__(self, base_url, username, users=10, duration=60, turns=(1, 5),
+                 think_time=(1.0, 5.0), questions=None, seed=None):
+        self.base_url = base_url
+        self.username = username
+        self.users = users
+        self.duration = duration
+        self.turns = turns
+        self.think_time = think_time
+        self.questions = questions or DEFAULT_QUESTIONS
+        self.random = random.Random(seed)
+        self.stats = {}
+
+    async def timed(self, endpoint, method, path, body=None):
+        started = time.perf_counter()
+        try:
+            status, content = await http_request(self.base_url, method, path, body)
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            status, content = 0, b''
+        self.stats.setdefault(endpoint, EndpointStats()).record(status, time.perf_counter() - started)
+        return status, content
+
+    async def visitor(self, deadline):
+        widget_path = f"/chatbot/widget/{self.username}/"
+        while time.monotonic() < deadline:
+            await self.timed('widget', 'GET', widget_path)
+            await self.timed('widget_script', 'GET', f"{widget_path}script.js")
+
+            session_id = None
+            for _ in range(self.random.randint(*self.turns)):
+                if time.monotonic() >= deadline:
+                    return
+                body = {'message': self.random.choice(self.questions)}
+                if session_id:
+                    body['session_id'] = session_id
+                    endpoint = 'chat_continue'
+                else:
+                    body['username'] = self.username
+                    endpoint = 'chat_new_session'
+                status, content = await self.timed(endpoint, 'POST', '/chatbot/api/chat/', body)
+                if status == 200 and not session_id:
+                    session_id = json.loads(content).get('session_id')
+                elif status != 200 and not session_id:
+                    break
+                await asyncio.sleep(self.random.uniform(*self.think_time))
+
+    async def run(self):
+        started = time.monotonic()
+        deadline = started + self.duration
+        await asyncio.gather(*(self.visitor(deadline) for _ in range(self.users)))
+        elapsed = time.monotonic() - started
+        return {endpoint: stats.summary(elapsed) for endpoint, stats in sorted(self.stats.items())}
@@ -0,0 +1,38 @@
+import os
+import time
+import fcntl
+from contextlib import contextmanager
+from . import metrics
+from .snapshots import get_index_root
+
+class IndexWarmingUp(Exception):
+    """Another worker is building this user's index and we stopped waiting for it"""
+
+@contextmanager
+def index_build_lock(user_id, timeout):
+    """Hold the cross-process build lock for a user's index.
+
+    Yields True if we had to wait for another builder first. Raises
+    IndexWarmingUp if the lock isn't free within `timeout` seconds.
+    """
+    root = get_index_root(user_id)
+    os.makedirs(root, exist_ok=True)
+    started = time.monotonic()
+    waited = False
+    with open(os.path.join(root, 'build.lock'), 'a') as lock_file:
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except BlockingIOError:
+                waited = True
+                if time.monotonic() - started >= timeout:
+                    metrics.increment("index_build.warming_up")
+                    raise IndexWarmingUp(f"Index for user {user_id} is still being built")
+                time.sleep(0.1)
+
+        metrics.observe("index_build.lock_wait_ms", (time.monotonic() - started) * 1000)
+        try:
+            yield waited
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,105 @@
+import os
+import re
+import time
+import random
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from repo.models import Content
+from chatbot.chunking import RecursiveChunker, get_chunker
+from chatbot.utils import get_content_text, get_embeddings_model
+
+SENTENCE_RE = re.compile(r'[^.!?\n]{40,200}[.!?]')
+
+def normalize(text):
+    return ' '.join(text.split())
+
+class Command(BaseCommand):
+    help = "Compare the configured per-type chunkers with the legacy recursive splitter"
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--username', help="Benchmark this user's repository content")
+        source.add_argument('--path', help="Benchmark .txt/.md files under this directory (as 'text' content)")
+        parser.add_argument('--repeat', type=int, default=3, help="Timing repetitions")
+        parser.add_argument('--queries', type=int, default=100, help="Sentences sampled as retrieval queries")
+        parser.add_argument('--k', type=int, default=5)
+        parser.add_argument('--skip-retrieval', action='store_true', help="Skip the embedding-based quality check")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def load_documents(self, options):
+        if options['path']:
+            documents = []
+            for root, _, files in os.walk(options['path']):
+                for name in sorted(files):
+                    if name.endswith(('.txt', '.md')):
+                        with open(os.path.join(root, name), 'r', encoding='utf-8', errors='replace') as file:
+                            documents.append(('text', file.read()))
+            return documents
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} not found")
+        documents = []
+        for content in Content.objects.filter(user=user):
+            text = get_content_text(content)
+            if text:
+                documents.append((content.content_type, text))
+        return documents
+
+    def chunk_all(self, documents, chunker_for, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            chunks = [chunk for content_type, text in documents for chunk in chunker_for(content_type).split(text)]
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return chunks, best
+
+    def retrieval_quality(self, chunks, queries, k):
+        """hit@k and MRR: does a top-k chunk contain the sentence used as the query?"""
+        import numpy as np
+        embeddings = get_embeddings_model()
+        chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+        query_vectors = np.asarray(embeddings.embed_documents(queries), dtype=np.float32)
+        chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True) + 1e-12
+        query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True) + 1e-12
+        normalized_chunks = [normalize(chunk) for chunk in chunks]
+
+        hits = 0
+        reciprocal_ranks = 0.0
+        for query, scores in zip(queries, query_vectors @ chunk_vectors.T):
+            target = normalize(query)
+            for rank, index in enumerate(np.argsort(-scores)[:k], start=1):
+                if target in normalized_chunks[index]:
+                    hits += 1
+                    reciprocal_ranks += 1.0 / rank
+                    break
+        return hits / len(queries), reciprocal_ranks / len(queries)
+
+    def handle(self, *args, **options):
+        documents = self.load_documents(options)
+        if not documents:
+            raise CommandError("No content to benchmark")
+        total_chars = sum(len(text) for _, text in documents)
+
+        legacy = RecursiveChunker(1000, 200)
+        schemes = [
+            ('recursive (legacy)', lambda content_type: legacy),
+            ('configured', get_chunker),
+        ]
+
+        sentences = [normalize(m.group(0)) for _, text in documents for m in SENTENCE_RE.finditer(text)]
+        queries = random.Random(options['seed']).sample(sentences, min(options['queries'], len(sentences)))
+
+        self.stdout.write(f"{len(documents)} documents, {total_chars / 1e6:.2f} MB of text, {len(queries)} queries")
+        for name, chunker_for in schemes:
+            chunks, elapsed = self.chunk_all(documents, chunker_for, options['repeat'])
+            line = (
+                f"{name:<20} chunks {len(chunks):>7}  "
+                f"avg {sum(map(len, chunks)) / max(1, len(chunks)):>6.0f} chars  "
+                f"{total_chars / 1e6 / elapsed if elapsed else float('inf'):>7.1f} MB/s"
+            )
+            if queries and not options['skip_retrieval']:
+                hit_rate, mrr = self.retrieval_quality(chunks, queries, options['k'])
+                line += f"  hit@{options['k']} {hit_rate:.3f}  MRR {mrr:.3f}"
+            self.stdout.write(line)
@@ -0,0 +1,63 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter: time the entry point import and URLconf load
+# (which imports every view module), then report RSS and heavy modules pulled in.
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+imported = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter()
+rss_kb = 0
+with open('/proc/self/status') as status:
+    for line in status:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'ready_ms': (ready - started) * 1000,
+    'rss_mb': rss_kb / 1024,
+    'heavy_modules': sorted(m for m in ('langchain', 'faiss', 'numpy', 'openai', 'torch') if m in sys.modules),
+}))
+"""
+
+class Command(BaseCommand):
+    help = "Measure cold-start import time and RSS of the WSGI and ASGI entry points"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per entry point")
+        parser.add_argument('--entry-point', action='append', dest='entry_points',
+                            help="Module to import (default: askademia.wsgi and askademia.asgi)")
+
+    def probe(self, module):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'askademia.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, module],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise CommandError(f"Importing {module} failed:\n{result.stderr}")
+        return json.loads(result.stdout.strip().splitlines()[-1])
+
+    def handle(self, *args, **options):
+        entry_points = options['entry_points'] or ['askademia.wsgi', 'askademia.asgi']
+        for module in entry_points:
+            samples = [self.probe(module) for _ in range(options['runs'])]
+            self.stdout.write(
+                f"{module}: "
+                f"import {statistics.median(s['import_ms'] for s in samples):.0f} ms, "
+                f"ready {statistics.median(s['ready_ms'] for s in samples):.0f} ms, "
+                f"rss {statistics.median(s['rss_mb'] for s in samples):.1f} MB "
+                f"(median of {len(samples)}); "
+                f"heavy modules loaded: {', '.join(samples[-1]['heavy_modules']) or 'none'}"
+            )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from chatbot.bundles import BundleError, export_bundle
+
+class Command(BaseCommand):
+    help = "Export a user's index (chunks, vectors, content ids) to a single bundle file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help="Bundle file to write")
+        parser.add_argument('--float16', action='store_true', help="Store vectors as float16 to halve their size")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+            count = export_bundle(user, options['path'], float16=options['float16'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} not found")
+        except BundleError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Exported {count} chunks to {options['path']}"))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from chatbot.bundles import BundleError, import_bundle
+
+class Command(BaseCommand):
+    help = "Load a knowledge-base bundle into a user's index without re-embedding"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('path', help="Bundle file to read")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+            count, missing_ids = import_bundle(user, options['path'])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} not found")
+        except BundleError as e:
+            raise CommandError(str(e))
+        if missing_ids:
+            self.stdout.write(self.style.WARNING(
+                f"{len(missing_ids)} content IDs in the bundle don't belong to this user: {missing_ids[:20]}"
+            ))
+        self.stdout.write(self.style.SUCCESS(f"Imported {count} chunks from {options['path']}"))
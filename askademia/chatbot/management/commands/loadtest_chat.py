@@ -0,0 +1,49 @@
+import json
+import asyncio
+from django.core.management.base import BaseCommand
+from chatbot.loadtest import LoadTest
+
+class Command(BaseCommand):
+    help = "Load-test chat_api and the widget endpoints and report throughput and latency percentiles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help="Owner of the chatbot widget under test")
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=20, help="Concurrent simulated visitors")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run")
+        parser.add_argument('--min-turns', type=int, default=1)
+        parser.add_argument('--max-turns', type=int, default=5)
+        parser.add_argument('--min-think', type=float, default=1.0, help="Seconds between a visitor's messages")
+        parser.add_argument('--max-think', type=float, default=5.0)
+        parser.add_argument('--questions-file', help="One question per line")
+        parser.add_argument('--seed', type=int)
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+
+    def handle(self, *args, **options):
+        questions = None
+        if options['questions_file']:
+            with open(options['questions_file'], 'r', encoding='utf-8') as file:
+                questions = [line.strip() for line in file if line.strip()]
+
+        load_test = LoadTest(
+            options['base_url'],
+            options['username'],
+            users=options['users'],
+            duration=options['duration'],
+            turns=(options['min_turns'], options['max_turns']),
+            think_time=(options['min_think'], options['max_think']),
+            questions=questions,
+            seed=options['seed']
+        )
+        report = asyncio.run(load_test.run())
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'endpoint':<18}{'reqs':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for endpoint, summary in report.items():
+            self.stdout.write(
+                f"{endpoint:<18}{summary['requests']:>7}{summary['throughput_rps']:>8.1f}"
+                f"{summary['p50_ms']:>9.0f}{summary['p95_ms']:>9.0f}{summary['p99_ms']:>9.0f}"
+                f"{summary['error_rate']:>8.1%}"
+            )
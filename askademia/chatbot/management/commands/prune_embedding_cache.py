@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from chatbot.embedding_cache import prune_embedding_cache, read_snapshot_keys
+from chatbot.snapshots import iter_snapshot_paths
+
+class Command(BaseCommand):
+    help = "Delete cached document embeddings that no index snapshot was built from"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age-hours', type=float, default=24,
+                            help="Keep unreferenced entries written more recently than this (builds in progress)")
+        parser.add_argument('--force', action='store_true',
+                            help="Prune even though some snapshots predate key tracking; their next build re-embeds")
+
+    def handle(self, *args, **options):
+        referenced = set()
+        untracked = 0
+        for path in iter_snapshot_paths():
+            keys = read_snapshot_keys(path)
+            if keys is None:
+                untracked += 1
+            else:
+                referenced |= keys
+
+        if untracked and not options['force']:
+            raise CommandError(
+                f"{untracked} snapshots were built before cache keys were recorded, so pruning could "
+                f"discard embeddings they still need. Rebuild those indexes first or pass --force."
+            )
+
+        removed, freed = prune_embedding_cache(referenced, options['min_age_hours'] * 3600)
+        self.stdout.write(self.style.SUCCESS(
+            f"Removed {removed} cache entries ({freed / 1e6:.1f} MB); {len(referenced)} still referenced"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from chatbot.stub_llm import StubLLMServer
+
+class Command(BaseCommand):
+    help = "Serve an OpenAI-compatible stub LLM/embedding API with injectable latency and errors"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8900)
+        parser.add_argument('--latency-ms', type=float, default=300, help="Mean chat completion latency")
+        parser.add_argument('--jitter-ms', type=float, default=100, help="Standard deviation of injected latency")
+        parser.add_argument('--embedding-latency-ms', type=float, default=20)
+        parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a 500")
+        parser.add_argument('--dimensions', type=int, default=1536)
+        parser.add_argument('--seed', type=int)
+
+    def handle(self, *args, **options):
+        server = StubLLMServer(
+            (options['host'], options['port']),
+            latency_ms=options['latency_ms'],
+            jitter_ms=options['jitter_ms'],
+            embedding_latency_ms=options['embedding_latency_ms'],
+            error_rate=options['error_rate'],
+            dimensions=options['dimensions'],
+            seed=options['seed']
+        )
+        self.stdout.write(f"Stub LLM listening on http://{options['host']}:{options['port']}/v1 "
+                          f"(set LLM_API_BASE to this URL)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
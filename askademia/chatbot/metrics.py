@@ -0,0 +1,30 @@
+import threading
+
+# In-process metrics; each worker keeps its own counters
+_lock = threading.Lock()
+_counters = {}
+_summaries = {}
+
+def increment(name, amount=1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def observe(name, value):
+    """Record an observation (e.g. a batch size or wait time)"""
+    with _lock:
+        summary = _summaries.get(name)
+        if summary is None:
+            summary = _summaries[name] = {"count": 0, "sum": 0.0, "min": value, "max": value}
+        summary["count"] += 1
+        summary["sum"] += value
+        summary["min"] = min(summary["min"], value)
+        summary["max"] = max(summary["max"], value)
+
+def snapshot():
+    """Return a copy of all counters and summaries"""
+    with _lock:
+        summaries = {}
+        for name, summary in _summaries.items():
+            summaries[name] = dict(summary, avg=summary["sum"] / summary["count"])
+        return {"counters": dict(_counters), "summaries": summaries}
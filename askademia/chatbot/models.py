@@ -8,6 +8,8 @@ class ChatbotConfig(models.Model):
     welcome_message = models.TextField(default='Hello! I am Askademia! How can I help you today?')
     confidence_threshold = models.FloatField(default=0.7)  # 70% threshold for response confidence
     enable_web_links = models.BooleanField(default=True)
+    early_exit_enabled = models.BooleanField(default=False)  # Skip the LLM when retrieval confidence is too low
+    early_exit_floor = models.FloatField(default=0.3)
     is_active = models.BooleanField(default=True)
     embed_code = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -35,6 +37,7 @@ class ChatMessage(models.Model):
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPES)
     content = models.TextField()
     confidence_score = models.FloatField(null=True, blank=True)  # Only for assistant messages
+    llm_provider = models.CharField(max_length=50, blank=True, null=True)  # Provider that answered, for assistant messages
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
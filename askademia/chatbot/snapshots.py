@@ -0,0 +1,99 @@
+import os
+import time
+import uuid
+import shutil
+import logging
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+SNAPSHOTS_DIR = 'snapshots'
+
+def get_index_root(user_id):
+    """Directory holding all index snapshots for a user"""
+    return os.path.join(settings.MEDIA_ROOT, 'vectorstores', f"user_{user_id}")
+
+def iter_snapshot_paths():
+    """Paths of every snapshot on disk, for all users"""
+    root = os.path.join(settings.MEDIA_ROOT, 'vectorstores')
+    try:
+        user_dirs = os.listdir(root)
+    except FileNotFoundError:
+        return
+    for user_dir in user_dirs:
+        snapshots_root = os.path.join(root, user_dir, SNAPSHOTS_DIR)
+        try:
+            versions = os.listdir(snapshots_root)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        for version in versions:
+            yield os.path.join(snapshots_root, version)
+
+def current_snapshot(user_id):
+    """Return (version, path) of the published snapshot, or (None, None)"""
+    root = get_index_root(user_id)
+    try:
+        with open(os.path.join(root, CURRENT_FILE), 'r', encoding='utf-8') as file:
+            version = file.read().strip()
+    except FileNotFoundError:
+        # Indexes saved before snapshots existed live directly in the user directory
+        if os.path.exists(os.path.join(root, 'index.faiss')):
+            return 'legacy', root
+        return None, None
+    return version, os.path.join(root, SNAPSHOTS_DIR, version)
+
+def publish_snapshot(user_id, write):
+    """Write a new snapshot with write(path), then atomically make it current.
+
+    Readers keep using the previous snapshot until the pointer swap, which is
+    a single os.replace of the CURRENT file.
+    """
+    root = get_index_root(user_id)
+    version = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+    path = os.path.join(root, SNAPSHOTS_DIR, version)
+    os.makedirs(path)
+    try:
+        write(path)
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+    tmp_pointer = os.path.join(root, f"{CURRENT_FILE}.{version}.tmp")
+    with open(tmp_pointer, 'w', encoding='utf-8') as file:
+        file.write(version)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_pointer, os.path.join(root, CURRENT_FILE))
+
+    collect_garbage(user_id)
+    return version, path
+
+def collect_garbage(user_id, keep=None):
+    """Delete old snapshots, keeping the current one and the newest `keep` before it"""
+    keep = settings.VECTOR_STORE_KEEP_SNAPSHOTS if keep is None else keep
+    current, _ = current_snapshot(user_id)
+    if current in (None, 'legacy'):
+        return 0
+    snapshots_root = os.path.join(get_index_root(user_id), SNAPSHOTS_DIR)
+    try:
+        versions = sorted(os.listdir(snapshots_root), reverse=True)
+    except FileNotFoundError:
+        return 0
+
+    # Versions sort by creation time; anything newer than current is an in-progress build
+    older = [version for version in versions if version < current]
+
+    # Files from a pre-snapshot index are superseded once anything is published
+    for name in ('index.faiss', 'index.pkl'):
+        legacy_path = os.path.join(get_index_root(user_id), name)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    removed = 0
+    for version in older[keep:]:
+        shutil.rmtree(os.path.join(snapshots_root, version), ignore_errors=True)
+        removed += 1
+    if removed:
+        logger.info("Removed %s old index snapshots for user %s", removed, user_id)
+    return removed
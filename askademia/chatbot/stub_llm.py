@@ -0,0 +1,101 @@
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubLLMServer(ThreadingHTTPServer):
+    """OpenAI-compatible chat/embeddings stand-in with injectable latency and errors.
+
+    Point LLM_API_BASE at http://host:port/v1 to use it.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=300, jitter_ms=100, embedding_latency_ms=20,
+                 error_rate=0.0, dimensions=1536, seed=None):
+        super().__init__(address, StubLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.embedding_latency_ms = embedding_latency_ms
+        self.error_rate = error_rate
+        self.dimensions = dimensions
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+
+    def delay(self, base_ms):
+        with self.random_lock:
+            jitter = self.random.gauss(0, self.jitter_ms) if self.jitter_ms else 0
+        time.sleep(max(0.0, base_ms + jitter) / 1000)
+
+    def should_fail(self):
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+
+    def embed(self, item):
+        # Deterministic pseudo-embedding so identical inputs always match
+        seed = int.from_bytes(hashlib.sha256(json.dumps(item).encode('utf-8')).digest()[:8], 'big')
+        rng = random.Random(seed)
+        vector = [rng.gauss(0, 1) for _ in range(self.dimensions)]
+        norm = sum(x * x for x in vector) ** 0.5
+        return [x / norm for x in vector]
+
+class StubLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.path.endswith('/chat/completions'):
+            self.server.delay(self.server.latency_ms)
+            if self.server.should_fail():
+                return self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            question = request.get('messages', [{}])[-1].get('content', '')
+            self.send_json(200, {
+                'id': 'chatcmpl-stub',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'stub'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': f"Stub answer ({len(question)} chars of prompt)."},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {'prompt_tokens': len(question) // 4, 'completion_tokens': 8, 'total_tokens': len(question) // 4 + 8}
+            })
+        elif self.path.endswith('/embeddings'):
+            self.server.delay(self.server.embedding_latency_ms)
+            if self.server.should_fail():
+                return self.send_json(500, {'error': {'message': 'Injected failure', 'type': 'server_error'}})
+            inputs = request.get('input', [])
+            if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            self.send_json(200, {
+                'object': 'list',
+                'data': [
+                    {'object': 'embedding', 'index': i, 'embedding': self.server.embed(item)}
+                    for i, item in enumerate(inputs)
+                ],
+                'model': request.get('model', 'stub'),
+                'usage': {'prompt_tokens': 0, 'total_tokens': 0}
+            })
+        else:
+            self.send_json(404, {'error': {'message': 'Not found'}})
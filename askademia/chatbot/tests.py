@@ -1,3 +1,752 @@
-from django.test import TestCase
+import io
+import os
+import sys
+import re
+import json
+import random
+import time
+import zlib
+import fcntl
+import tempfile
+import threading
+import numpy as np
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import resolve
+from langchain.embeddings.base import Embeddings
+from .bundles import FORMAT_VERSION, MAGIC, PREAMBLE, BundleError, export_bundle, import_bundle, read_bundle
+from .chunking import StructuredChunker, WholeChunker
+from .dispatcher import EmbeddingDispatcher
+from .forms import ChatbotConfigForm
+from .embeddings import LocalEmbeddings, make_batches, split_torch_threads
+from .embedding_cache import EmbeddingCache, write_snapshot_keys
+from .llm_router import CircuitBreaker, LLMRouter, LLMUnavailable, Provider
+from .loadtest import EndpointStats
+from .locks import IndexWarmingUp, index_build_lock
+from .models import ChatbotConfig
+from repo.lookup import get_content_lookup
+from repo.models import Content
+from .snapshots import current_snapshot, get_index_root, publish_snapshot
+from . import metrics, utils, views
 
-# Create your tests here.
+class StructuredChunkerTests(SimpleTestCase):
+    def test_keeps_heading_with_its_section(self):
+        text = "# Week 1\n\nIntro to recursion.\n\n# Week 2\n\nSorting algorithms."
+        chunks = StructuredChunker(1000, 200).split(text)
+        self.assertEqual(chunks, ["Week 1\n\nIntro to recursion.", "Week 2\n\nSorting algorithms."])
+
+    def test_setext_heading(self):
+        chunks = StructuredChunker(1000, 200).split("Overview\n========\n\nBody text.")
+        self.assertEqual(chunks, ["Overview\n\nBody text."])
+
+    def test_chunks_respect_size_and_carry_overlap(self):
+        paragraphs = [f"Paragraph {i} " + "word " * 30 for i in range(20)]
+        chunks = StructuredChunker(500, 200).split("# Notes\n\n" + "\n\n".join(paragraphs))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 500)
+            self.assertTrue(chunk.startswith("Notes\n\n"))
+        # The last paragraph of a chunk opens the next one
+        self.assertEqual(chunks[0].split("\n\n")[-1], chunks[1].split("\n\n")[1])
+
+    def test_long_paragraph_split_at_sentences(self):
+        paragraph = " ".join(f"Sentence number {i} is here." for i in range(100))
+        chunks = StructuredChunker(300, 0).split(paragraph)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 300)
+            self.assertTrue(chunk.endswith("."))
+        self.assertEqual(" ".join(chunks), paragraph)
+
+    def test_long_setext_heading_is_not_a_heading(self):
+        text = 'This is a long first paragraph line. ' * 30 + '\n-----\n\nBody'
+        chunks = StructuredChunker(1000, 200).split(text)
+        self.assertTrue(chunks)
+        self.assertTrue(all(len(chunk) <= 1000 for chunk in chunks))
+        self.assertEqual(chunks[-1].split("\n\n")[-1], "Body")
+
+    def test_heading_longer_than_chunk_is_not_repeated(self):
+        heading = "# " + "Very long heading " * 5
+        text = heading + "\n\n" + "Some words in a sentence. " * 20
+        chunks = StructuredChunker(120, 0).split(text)
+        self.assertTrue(chunks)
+        for chunk in chunks:
+            self.assertLessEqual(len(chunk), 120)
+        # Kept once as body text rather than repeated on every chunk
+        self.assertEqual(sum(chunk.startswith("Very long heading") for chunk in chunks), 1)
+
+    def test_tiny_chunk_size_terminates(self):
+        chunks = StructuredChunker(10, 0).split("A heading line\n-----\n\n" + "x" * 50)
+        self.assertEqual("".join(chunks).replace(" ", ""), "Aheadingline" + "x" * 50)
+
+    def test_headings_without_text_are_kept(self):
+        chunker = StructuredChunker(1000, 200)
+        self.assertEqual(
+            chunker.split('CS101 SYLLABUS\n\nMIDTERM: OCT 3\n\nFINAL EXAM: DEC 10 IN ROOM 204'),
+            ['CS101 SYLLABUS\n\nMIDTERM: OCT 3\n\nFINAL EXAM: DEC 10 IN ROOM 204']
+        )
+        self.assertEqual(
+            chunker.split('# Course Overview\n\n# Week 1\n\nIntro to recursion.\n\n# Week 2'),
+            ['Course Overview', 'Week 1\n\nIntro to recursion.', 'Week 2']
+        )
+
+    def test_every_word_survives(self):
+        rng = random.Random(0)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'recursion', 'exam', 'lab', 'week', 'notes', 'tuple']
+
+        def sentence():
+            return ' '.join(rng.choice(words) + str(rng.randint(0, 99)) for _ in range(rng.randint(1, 8))) + '.'
+
+        def block():
+            kind = rng.randint(0, 5)
+            if kind == 0:
+                return '#' * rng.randint(1, 6) + ' ' + sentence()
+            if kind == 1:
+                return f"WEEK {rng.randint(1, 99)}: {rng.choice(words).upper()}"
+            if kind == 2:
+                return sentence() + '\n' + rng.choice(['====', '----'])
+            if kind == 3:
+                return ''
+            return '\n'.join(sentence() for _ in range(rng.randint(1, 4)))
+
+        for _ in range(1000):
+            text = '\n\n'.join(block() for _ in range(rng.randint(1, 12)))
+            chunker = StructuredChunker(rng.choice([120, 300, 1000]), rng.choice([0, 50, 200]))
+            output = set(' '.join(chunker.split(text)).split())
+            expected = {token for token in text.split() if not re.fullmatch(r'#+|=+|-+', token)}
+            self.assertEqual(expected - output, set(), text)
+
+class WholeChunkerTests(SimpleTestCase):
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(WholeChunker(2000).split("  A short description.  "), ["A short description."])
+        self.assertEqual(WholeChunker(2000).split("   "), [])
+
+    def test_long_text_falls_back(self):
+        text = "\n\n".join("Paragraph text here. " * 10 for _ in range(20))
+        chunks = WholeChunker(500, 300, 0).split(text)
+        self.assertGreater(len(chunks), 1)
+        self.assertTrue(all(len(chunk) <= 300 for chunk in chunks))
+
+class SlowEmbeddings:
+    """Records batch sizes; each call takes long enough for a backlog to build"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.batches.append(len(texts))
+        time.sleep(self.delay)
+        return [[float(len(text))] for text in texts]
+
+class EmbeddingDispatcherTests(SimpleTestCase):
+    def test_results_match_queries(self):
+        dispatcher = EmbeddingDispatcher(SlowEmbeddings(0), max_wait_ms=5, max_batch_size=4)
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            vectors = list(pool.map(dispatcher.embed_query, ["a" * i for i in range(10)]))
+        self.assertEqual(vectors, [[float(i)] for i in range(10)])
+
+    def test_backlog_goes_out_in_full_batches(self):
+        embeddings = SlowEmbeddings(0.05)
+        dispatcher = EmbeddingDispatcher(embeddings, max_wait_ms=10, max_batch_size=8)
+        first = dispatcher.submit("first")
+        while not embeddings.batches:
+            time.sleep(0.001)
+        # Queued while the first call is running
+        futures = [dispatcher.submit(f"query {i}") for i in range(20)]
+        first.result()
+        for future in futures:
+            future.result()
+        self.assertEqual(embeddings.batches, [1, 8, 8, 4])
+
+class FakeClient:
+    def __init__(self, name, delay=0.0, fail=False):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+
+    def predict(self, prompt):
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.name} is down")
+        return f"{self.name}: {prompt}"
+
+def make_router(clients, max_in_flight=32, **kwargs):
+    providers = [
+        Provider(client.name, lambda name, client=client: client,
+                 CircuitBreaker(failure_threshold=2, reset_seconds=60), max_in_flight=max_in_flight)
+        for client in clients
+    ]
+    return LLMRouter(providers, **kwargs)
+
+class LLMRouterTests(SimpleTestCase):
+    def test_concurrent_calls_do_not_queue(self):
+        router = make_router([FakeClient('primary', delay=0.2)], timeout=0.5)
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(router.invoke, [str(i) for i in range(16)]))
+        self.assertLess(time.monotonic() - started, 0.45)
+        self.assertEqual(results[3], ("primary: 3", "primary"))
+
+    def test_fails_over_and_opens_breaker(self):
+        router = make_router([FakeClient('primary', fail=True), FakeClient('backup')])
+        for _ in range(2):
+            self.assertEqual(router.invoke("hi"), ("backup: hi", "backup"))
+        self.assertFalse(router.providers[0].breaker.allow())
+
+    def test_hedges_slow_primary(self):
+        primary = FakeClient('primary', delay=0.01)
+        router = make_router([primary, FakeClient('backup')], hedge_min_samples=3)
+        for _ in range(3):
+            router.invoke("warm up")
+        primary.delay = 1.0
+        self.assertEqual(router.invoke("hi"), ("backup: hi", "backup"))
+
+    def test_unavailable(self):
+        router = make_router([FakeClient('primary', fail=True)])
+        with self.assertRaises(LLMUnavailable):
+            router.invoke("hi")
+
+    def test_busy_provider_is_skipped(self):
+        router = make_router([FakeClient('primary', delay=0.3), FakeClient('backup')], max_in_flight=1)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            first = pool.submit(router.invoke, "first")
+            time.sleep(0.05)
+            second = pool.submit(router.invoke, "second")
+            self.assertEqual(second.result(), ("backup: second", "backup"))
+            self.assertEqual(first.result(), ("primary: first", "primary"))
+
+    def test_all_providers_busy(self):
+        router = make_router([FakeClient('primary', delay=0.3)], max_in_flight=1)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            first = pool.submit(router.invoke, "first")
+            time.sleep(0.05)
+            with self.assertRaisesRegex(LLMUnavailable, "busy"):
+                router.invoke("second")
+            first.result()
+
+    def test_timeouts_open_breaker(self):
+        primary = FakeClient('primary', delay=0.3)
+        router = make_router([primary], timeout=0.05)
+        for _ in range(2):
+            with self.assertRaises(LLMUnavailable):
+                router.invoke("hi")
+        self.assertFalse(router.providers[0].breaker.allow())
+        # The late answers must not close it again
+        time.sleep(0.4)
+        self.assertFalse(router.providers[0].breaker.allow())
+
+    @override_settings(LLM_REQUEST_TIMEOUT=12.5, LLM_API_KEY='test')
+    def test_clients_get_request_timeout(self):
+        with mock.patch('langchain.chat_models.ChatOpenAI') as chat_openai, mock.patch.dict(os.environ):
+            utils.get_llm_client('openai')
+        self.assertEqual(chat_openai.call_args.kwargs['request_timeout'], 12.5)
+
+class LoadTestTests(SimpleTestCase):
+    def test_non_2xx_responses_are_errors(self):
+        stats = EndpointStats()
+        for status in (200, 204, 404, 503, 0):
+            stats.record(status, 0.01)
+        summary = stats.summary(1.0)
+        self.assertEqual(summary['error_rate'], 0.6)
+        self.assertEqual(summary['statuses'][404], 1)
+
+    def test_widget_script_route_exists(self):
+        match = resolve('/widget/alice/script.js', urlconf='chatbot.urls')
+        self.assertEqual(match.url_name, 'chatbot_widget_script')
+        self.assertEqual(match.kwargs, {'username': 'alice'})
+
+@override_settings(LOADED_INDEX_CACHE_SIZE=2)
+class LoadedStoreCacheTests(SimpleTestCase):
+    def setUp(self):
+        utils._loaded_stores.clear()
+
+    def tearDown(self):
+        utils._loaded_stores.clear()
+
+    def test_keeps_only_recent_users_and_current_version(self):
+        utils.remember_loaded_store(1, 'v1', 'store 1')
+        utils.remember_loaded_store(2, 'v1', 'store 2')
+        utils.remember_loaded_store(1, 'v2', 'store 1 v2')
+        self.assertEqual(utils.get_loaded_store(2), ('v1', 'store 2'))
+        utils.remember_loaded_store(3, 'v1', 'store 3')
+        self.assertIsNone(utils.get_loaded_store(1))
+        self.assertEqual(list(utils._loaded_stores), [2, 3])
+
+class ReadBundleTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'kb.askb')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, vectors, **overrides):
+        header = {
+            "model": "local:test", "dim": vectors.shape[1], "dtype": "float32", "count": len(vectors),
+            "content_ids": list(range(len(vectors))), "chunks": [f"chunk {i}" for i in range(len(vectors))],
+        }
+        header.update(overrides)
+        header_bytes = zlib.compress(json.dumps(header).encode('utf-8'))
+        with open(self.path, 'wb') as file:
+            file.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header_bytes)))
+            file.write(header_bytes)
+            file.write(vectors.astype(np.float32).tobytes())
+
+    def test_round_trip(self):
+        vectors = np.arange(12, dtype=np.float32).reshape(3, 4)
+        self.write(vectors)
+        header, loaded = read_bundle(self.path)
+        self.assertEqual(header["content_ids"], [0, 1, 2])
+        np.testing.assert_array_equal(loaded, vectors)
+
+    def test_rejects_misaligned_chunks_and_content_ids(self):
+        vectors = np.zeros((3, 4))
+        for overrides in ({"content_ids": [1, 2]}, {"chunks": ["only one"]}, {"count": 4, "dim": 3}):
+            self.write(vectors, **overrides)
+            with self.assertRaises(BundleError):
+                read_bundle(self.path)
+
+    def test_rejects_bad_header_values(self):
+        vectors = np.zeros((2, 4))
+        for overrides in ({"dim": 0, "count": 0}, {"dtype": "object"}, {"content_ids": ["a", "b"]}):
+            self.write(vectors, **overrides)
+            with self.assertRaises(BundleError):
+                read_bundle(self.path)
+
+class PruneEmbeddingCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir.name)
+        self.settings_override.enable()
+        self.cache = EmbeddingCache('local:test')
+        for key in ('a' * 64, 'b' * 64, 'c' * 64):
+            self.cache.put(key, ['chunk'], [[0.0, 1.0]])
+        # 'c' was written just now, as by a build still in progress
+        for key in ('a' * 64, 'b' * 64):
+            os.utime(self.cache._path(key), (0, 0))
+        snapshot = os.path.join(self.tmpdir.name, 'vectorstores', 'user_1', 'snapshots', 'v1')
+        os.makedirs(snapshot)
+        write_snapshot_keys(snapshot, {'a' * 64})
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def test_removes_only_old_unreferenced_entries(self):
+        call_command('prune_embedding_cache', stdout=io.StringIO())
+        self.assertIsNotNone(self.cache.get('a' * 64))
+        self.assertIsNone(self.cache.get('b' * 64))
+        self.assertIsNotNone(self.cache.get('c' * 64))
+
+    def test_refuses_when_snapshots_are_untracked(self):
+        os.makedirs(os.path.join(self.tmpdir.name, 'vectorstores', 'user_2', 'snapshots', 'v1'))
+        with self.assertRaises(CommandError):
+            call_command('prune_embedding_cache', stdout=io.StringIO())
+        self.assertIsNotNone(self.cache.get('b' * 64))
+
+class NoCallEmbeddings(Embeddings):
+    """Fails the test if anything tries to embed"""
+
+    def embed_documents(self, texts):
+        raise AssertionError("unexpected embedding call")
+
+    def embed_query(self, text):
+        raise AssertionError("unexpected embedding call")
+
+def write_local_model(path, dimension):
+    """The sentence-transformers module configs get_embeddings_dimension reads"""
+    os.makedirs(os.path.join(path, '1_Pooling'))
+    with open(os.path.join(path, 'modules.json'), 'w') as file:
+        json.dump([
+            {"idx": 0, "name": "0", "path": "", "type": "sentence_transformers.models.Transformer"},
+            {"idx": 1, "name": "1", "path": "1_Pooling", "type": "sentence_transformers.models.Pooling"},
+        ], file)
+    with open(os.path.join(path, '1_Pooling', 'config.json'), 'w') as file:
+        json.dump({"word_embedding_dimension": dimension}, file)
+
+def publish_index(user_id, chunks, vectors, content_ids):
+    """Publish a snapshot built from precomputed vectors"""
+    from langchain.vectorstores import FAISS
+    vector_store = FAISS.from_embeddings(list(zip(chunks, vectors)), NoCallEmbeddings())
+    vector_store.content_ids = np.asarray(content_ids, dtype=np.int64)
+    return publish_snapshot(user_id, lambda path: utils.save_vector_store(vector_store, path))
+
+class BundleRoundTripTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        model_path = os.path.join(self.tmpdir.name, 'model')
+        write_local_model(model_path, 4)
+        self.settings_override = override_settings(
+            MEDIA_ROOT=os.path.join(self.tmpdir.name, 'media'),
+            EMBEDDING_PROVIDER='local',
+            LOCAL_EMBEDDING_MODEL_PATH=model_path,
+        )
+        self.settings_override.enable()
+        patcher = mock.patch('chatbot.utils.get_embeddings_model', return_value=NoCallEmbeddings())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        mock.patch('chatbot.bundles.get_embeddings_model', return_value=NoCallEmbeddings()).start()
+        self.addCleanup(mock.patch.stopall)
+
+        self.source = User.objects.create_user(username='source', password='secret')
+        self.target = User.objects.create_user(username='target', password='secret')
+        self.chunks = ["Week one covers recursion.", "The exam is in December.", "Labs are on Fridays."]
+        self.vectors = np.random.default_rng(0).random((3, 4), dtype=np.float32)
+        publish_index(self.source.id, self.chunks, self.vectors, [7, 7, 9])
+        self.path = os.path.join(self.tmpdir.name, 'kb.askb')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def imported_store(self):
+        version, path = current_snapshot(self.target.id)
+        return utils.load_vector_store(self.target.id, version, path)
+
+    def round_trip(self, *flags):
+        call_command('export_knowledge_base', 'source', self.path, *flags, stdout=io.StringIO())
+        call_command('import_knowledge_base', 'target', self.path, stdout=io.StringIO())
+        vector_store = self.imported_store()
+        chunks = [
+            vector_store.docstore.search(vector_store.index_to_docstore_id[i]).page_content
+            for i in range(vector_store.index.ntotal)
+        ]
+        self.assertEqual(chunks, self.chunks)
+        self.assertEqual(vector_store.content_ids.tolist(), [7, 7, 9])
+        return vector_store.index.reconstruct_n(0, 3)
+
+    def test_float32_round_trip(self):
+        np.testing.assert_array_equal(self.round_trip(), self.vectors)
+
+    def test_float16_round_trip(self):
+        np.testing.assert_allclose(self.round_trip('--float16'), self.vectors, atol=1e-3)
+        self.assertEqual(read_bundle(self.path)[0]["dtype"], "float16")
+
+    def test_reports_content_ids_of_other_users(self):
+        export_bundle(self.source, self.path)
+        self.assertEqual(import_bundle(self.target, self.path), (3, [7, 9]))
+
+    def test_rejects_dimension_mismatch(self):
+        export_bundle(self.source, self.path)
+        model_path = os.path.join(self.tmpdir.name, 'wide-model')
+        write_local_model(model_path, 8)
+        # Same model key (directory name), different output size
+        os.rename(os.path.join(self.tmpdir.name, 'model'), os.path.join(self.tmpdir.name, 'old-model'))
+        os.rename(model_path, os.path.join(self.tmpdir.name, 'model'))
+        with self.assertRaisesRegex(BundleError, "4 dimensions .* produces 8"):
+            import_bundle(self.target, self.path)
+
+class IndexBuildLockTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir.name, INDEX_BUILD_LOCK_TIMEOUT=0.3)
+        self.settings_override.enable()
+        mock.patch('chatbot.utils.get_embeddings_model', return_value=NoCallEmbeddings()).start()
+        self.create_vector_store = mock.patch('chatbot.utils.create_vector_store', return_value='built').start()
+        self.addCleanup(mock.patch.stopall)
+        utils._loaded_stores.clear()
+        self.user = User.objects.create_user(username='teacher', password='secret')
+        ChatbotConfig.objects.create(user=self.user)
+
+    def tearDown(self):
+        utils._loaded_stores.clear()
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def hold_lock(self):
+        """Take the build lock from a second file descriptor, as another worker would"""
+        root = get_index_root(self.user.id)
+        os.makedirs(root, exist_ok=True)
+        lock_file = open(os.path.join(root, 'build.lock'), 'a')
+        self.addCleanup(lock_file.close)
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return lock_file
+
+    def publish(self):
+        return publish_index(self.user.id, ["Labs are on Fridays."], np.ones((1, 4), dtype=np.float32), [1])[0]
+
+    def test_lock_times_out_while_held(self):
+        self.hold_lock()
+        with self.assertRaises(IndexWarmingUp):
+            with index_build_lock(self.user.id, 0.2):
+                pass
+
+    def test_lock_reports_waiting(self):
+        lock_file = self.hold_lock()
+        threading.Timer(0.1, fcntl.flock, (lock_file, fcntl.LOCK_UN)).start()
+        with index_build_lock(self.user.id, 2) as waited:
+            self.assertTrue(waited)
+        with index_build_lock(self.user.id, 2) as waited:
+            self.assertFalse(waited)
+
+    def test_chat_api_returns_503_while_warming_up(self):
+        self.hold_lock()
+        request = RequestFactory().post(
+            '/api/chat/', json.dumps({'message': 'When are labs?', 'username': 'teacher'}),
+            content_type='application/json'
+        )
+        response = views.chat_api(request)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '5')
+        self.assertTrue(json.loads(response.content)['warming_up'])
+        self.create_vector_store.assert_not_called()
+
+    def test_joins_build_finished_while_waiting(self):
+        lock_file = self.hold_lock()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(utils.build_vector_store, self.user)
+            time.sleep(0.1)
+            self.publish()
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            vector_store = result.result()
+        self.assertEqual(vector_store.content_ids.tolist(), [1])
+        self.create_vector_store.assert_not_called()
+
+    def test_joins_build_finished_before_lock(self):
+        self.publish()
+        vector_store = utils.build_vector_store(self.user)
+        self.assertEqual(vector_store.content_ids.tolist(), [1])
+        self.create_vector_store.assert_not_called()
+
+    def test_rebuilds_stale_snapshot(self):
+        version = self.publish()
+        self.assertEqual(utils.build_vector_store(self.user, stale_version=version), 'built')
+
+class FakeTorch:
+    """Stands in for torch's process-wide thread setting"""
+
+    def __init__(self, threads=8):
+        self.threads = threads
+        self.history = []
+
+    def get_num_threads(self):
+        return self.threads
+
+    def set_num_threads(self, threads):
+        self.threads = threads
+        self.history.append(threads)
+
+class FakeModel:
+    """Encodes a text as [its length, its first character], recording each batch"""
+
+    def __init__(self, torch):
+        self.torch = torch
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def encode(self, texts, batch_size, **kwargs):
+        with self.lock:
+            self.calls.append((list(texts), batch_size, threading.current_thread().name, self.torch.threads))
+        time.sleep(0.01)
+        return np.asarray([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+class MakeBatchesTests(SimpleTestCase):
+    def test_limits_size_and_padded_chars(self):
+        texts = ["x" * random.Random(i).randint(1, 200) for i in range(300)]
+        batches = make_batches(texts, max_batch_size=16, max_batch_chars=1000)
+        self.assertEqual(sorted(i for batch in batches for i in batch), list(range(300)))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 16)
+            self.assertLessEqual(max(len(texts[i]) for i in batch) * len(batch), 1000)
+
+    def test_longest_first(self):
+        texts = ["a", "ccc", "bb", "dddd"]
+        self.assertEqual(make_batches(texts, max_batch_size=2, max_batch_chars=100), [[3, 1], [2, 0]])
+
+    def test_oversized_text_gets_its_own_batch(self):
+        texts = ["short", "x" * 500, "tiny"]
+        self.assertEqual(make_batches(texts, max_batch_size=8, max_batch_chars=100), [[1], [0, 2]])
+
+    def test_empty_texts_count_as_one_char(self):
+        self.assertEqual(make_batches(["", "", ""], max_batch_size=8, max_batch_chars=2), [[0, 1], [2]])
+
+class LocalEmbeddingsTests(SimpleTestCase):
+    def setUp(self):
+        self.torch = FakeTorch(threads=8)
+        self.model = FakeModel(self.torch)
+        patchers = [
+            mock.patch.dict(sys.modules, {'torch': self.torch}),
+            mock.patch('chatbot.embeddings.load_local_model', return_value=self.model),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_multi_batch_keeps_order_and_splits_threads(self):
+        texts = [chr(ord('a') + i % 26) * (1 + i % 7) for i in range(40)]
+        embeddings = LocalEmbeddings('/models/fake', max_batch_size=4, max_batch_chars=1000, num_threads=4)
+        vectors = embeddings.embed_documents(texts)
+        self.assertEqual(vectors, [[float(len(text)), float(ord(text[0]))] for text in texts])
+        self.assertEqual(len(self.model.calls), 10)
+        self.assertTrue(all(batch_size == len(batch) <= 4 for batch, batch_size, _, _ in self.model.calls))
+        self.assertGreater(len({thread for _, _, thread, _ in self.model.calls}), 1)
+        # Four workers share the four threads, then torch's own count comes back
+        self.assertEqual({threads for _, _, _, threads in self.model.calls}, {1})
+        self.assertEqual(self.torch.threads, 8)
+
+    def test_single_batch_stays_on_calling_thread(self):
+        embeddings = LocalEmbeddings('/models/fake', num_threads=4)
+        self.assertEqual(embeddings.embed_query("hello"), [5.0, float(ord('h'))])
+        self.assertEqual(self.model.calls[0][2], threading.current_thread().name)
+        self.assertEqual(self.torch.history, [])
+
+    def test_empty_input(self):
+        self.assertEqual(LocalEmbeddings('/models/fake').embed_documents([]), [])
+        self.assertEqual(self.model.calls, [])
+
+class SplitTorchThreadsTests(SimpleTestCase):
+    def test_restores_after_last_overlapping_user(self):
+        torch = FakeTorch(threads=8)
+        with mock.patch.dict(sys.modules, {'torch': torch}):
+            outer = split_torch_threads(2)
+            outer.__enter__()
+            with split_torch_threads(4):
+                self.assertEqual(torch.threads, 4)
+            # The outer encode is still running, so the split count stays
+            self.assertNotEqual(torch.threads, 8)
+            outer.__exit__(None, None, None)
+        self.assertEqual(torch.threads, 8)
+
+    def test_restores_on_error(self):
+        torch = FakeTorch(threads=6)
+        with mock.patch.dict(sys.modules, {'torch': torch}):
+            with self.assertRaises(RuntimeError):
+                with split_torch_threads(1):
+                    raise RuntimeError("encode failed")
+        self.assertEqual(torch.threads, 6)
+
+class EarlyExitTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='teacher', password='secret')
+        self.config = ChatbotConfig.objects.create(user=self.user, early_exit_enabled=True, early_exit_floor=0.4)
+        doc = mock.Mock(page_content="Labs are on Fridays.")
+        patchers = [
+            mock.patch('chatbot.utils.get_vector_store', return_value=object()),
+            mock.patch('chatbot.utils.search_vector_store', return_value=([doc], None, None)),
+            mock.patch('chatbot.utils.calculate_confidence_score', return_value=0.25),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        router = mock.Mock()
+        router.invoke.return_value = ("  Fridays.  ", "openai")
+        self.get_llm_router = mock.patch('chatbot.utils.get_llm_router', return_value=router).start()
+        self.addCleanup(mock.patch.stopall)
+
+    def counters(self):
+        counters = metrics.snapshot()["counters"]
+        return counters.get("early_exit.checked", 0), counters.get("early_exit.skipped", 0)
+
+    def test_skips_llm_below_floor(self):
+        checked, skipped = self.counters()
+        result = utils.generate_response(self.user, "When are labs?", config=self.config)
+        self.assertEqual(result, (utils.EARLY_EXIT_RESPONSE, 0.25, None))
+        self.get_llm_router.assert_not_called()
+        self.assertEqual(self.counters(), (checked + 1, skipped + 1))
+
+    def test_calls_llm_above_floor(self):
+        self.config.early_exit_floor = 0.2
+        checked, skipped = self.counters()
+        result = utils.generate_response(self.user, "When are labs?", config=self.config)
+        self.assertEqual(result, ("Fridays.", 0.25, "openai"))
+        self.assertEqual(self.counters(), (checked + 1, skipped))
+
+    def test_disabled_never_checks(self):
+        self.config.early_exit_enabled = False
+        self.config.save()
+        checked, skipped = self.counters()
+        self.assertEqual(utils.generate_response(self.user, "When are labs?")[2], "openai")
+        self.assertEqual(self.counters(), (checked, skipped))
+
+class ChatbotConfigFormTests(TestCase):
+    def form(self, **overrides):
+        data = {
+            'name': 'Assistant', 'welcome_message': 'Hi', 'confidence_threshold': 0.5,
+            'enable_web_links': True, 'early_exit_enabled': True, 'early_exit_floor': 0.3,
+        }
+        data.update(overrides)
+        return ChatbotConfigForm(data=data)
+
+    def test_floor_at_or_below_threshold_is_valid(self):
+        self.assertTrue(self.form().is_valid())
+        self.assertTrue(self.form(early_exit_floor=0.5).is_valid())
+
+    def test_floor_above_threshold_is_rejected(self):
+        form = self.form(early_exit_floor=0.6)
+        self.assertFalse(form.is_valid())
+        self.assertIn('early_exit_floor', form.errors)
+
+class QueryOnlyEmbeddings(NoCallEmbeddings):
+    """Embeds every query to the same vector; documents are never embedded"""
+
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0, 0.0]
+
+class ContentLookupTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(MEDIA_ROOT=self.tmpdir.name)
+        self.settings_override.enable()
+        mock.patch('chatbot.utils.get_embeddings_model', return_value=QueryOnlyEmbeddings()).start()
+        self.addCleanup(mock.patch.stopall)
+        utils._loaded_stores.clear()
+        cache.clear()
+        self.user = User.objects.create_user(username='teacher', password='secret')
+        self.syllabus = self.content('Syllabus')
+        self.schedule = self.content('Schedule')
+        self.chunks = ["Week one covers recursion.", "Labs are on Fridays.", "The exam is in December."]
+        self.vectors = np.eye(3, 4, dtype=np.float32)
+        self.content_ids = [self.syllabus.pk, self.schedule.pk, self.schedule.pk]
+
+    def tearDown(self):
+        utils._loaded_stores.clear()
+        self.settings_override.disable()
+        self.tmpdir.cleanup()
+
+    def content(self, title):
+        return Content.objects.create(
+            title=title, content_type='link', web_link='https://example.com/', user=self.user
+        )
+
+    def search(self):
+        version, path = current_snapshot(self.user.id)
+        vector_store = utils.load_vector_store(self.user.id, version, path)
+        docs, _, _ = utils.search_vector_store(self.user.id, vector_store, "recursion", k=3)
+        return [(doc.page_content, doc.metadata["title"]) for doc in docs]
+
+    def test_deleted_content_is_dropped(self):
+        publish_index(self.user.id, self.chunks, self.vectors, self.content_ids)
+        self.schedule.delete()
+        self.assertEqual(self.search(), [("Week one covers recursion.", "Syllabus")])
+
+    def test_rename_shows_without_reindexing(self):
+        publish_index(self.user.id, self.chunks, self.vectors, self.content_ids)
+        version, _ = current_snapshot(self.user.id)
+        self.assertEqual(self.search()[0], ("Week one covers recursion.", "Syllabus"))
+        with self.assertNumQueries(0):
+            get_content_lookup(self.user.id)
+
+        self.syllabus.title = 'Course syllabus'
+        self.syllabus.save()
+        self.assertEqual(get_content_lookup(self.user.id)[self.syllabus.pk]["title"], 'Course syllabus')
+        self.assertEqual(self.search()[0], ("Week one covers recursion.", "Course syllabus"))
+        self.assertEqual(current_snapshot(self.user.id)[0], version)
+
+    def test_snapshot_without_content_ids_file(self):
+        from langchain.vectorstores import FAISS
+        # Older snapshots only kept the content id in each chunk's metadata
+        vector_store = FAISS.from_embeddings(
+            list(zip(self.chunks, self.vectors)), NoCallEmbeddings(),
+            metadatas=[{"id": content_id} for content_id in self.content_ids]
+        )
+        version, path = publish_snapshot(self.user.id, vector_store.save_local)
+        self.assertFalse(os.path.exists(os.path.join(path, utils.CONTENT_IDS_FILE)))
+        loaded = utils.load_vector_store(self.user.id, version, path)
+        self.assertEqual(loaded.content_ids.tolist(), self.content_ids)
+        self.assertEqual([title for _, title in self.search()], ['Syllabus', 'Schedule', 'Schedule'])
@@ -9,5 +9,7 @@ urlpatterns = [
     path('test/', views.chatbot_test, name='chatbot_test'),
     path('gaps/', views.knowledge_gaps, name='knowledge_gaps'),
     path('gaps/<int:gap_id>/resolve/', views.resolve_gap, name='resolve_gap'),
+    path('api/metrics/', views.metrics_api, name='metrics_api'),
     path('widget/<str:username>/', views.chatbot_widget, name='chatbot_widget'),
+    path('widget/<str:username>/script.js', views.chatbot_widget, name='chatbot_widget_script'),
 ]
\ No newline at end of file
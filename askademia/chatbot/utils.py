@@ -1,26 +1,35 @@
 import os
 import json
-import numpy as np
+import logging
+import threading
+from collections import OrderedDict
 from django.conf import settings
-from langchain.embeddings import OpenAIEmbeddings
-from langchain.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains import RetrievalQA
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
 from repo.models import Content, Folder
+from repo.lookup import get_content_lookup
+from .models import ChatbotConfig
+from . import metrics
+from .snapshots import current_snapshot, publish_snapshot
+from .locks import index_build_lock
 
-def get_llm_client():
+logger = logging.getLogger(__name__)
+
+# Provider, vector-store and numpy modules are imported inside the functions that
+# use them, so workers that never answer a chat don't pay for loading them.
+
+def get_llm_client(llm_provider=None):
     """Get the LLM client based on configuration"""
-    llm_provider = settings.LLM_PROVIDER
+    llm_provider = llm_provider or settings.LLM_PROVIDER
     api_key = settings.LLM_API_KEY
     
     if llm_provider == 'openai':
+        from langchain.chat_models import ChatOpenAI
         os.environ["OPENAI_API_KEY"] = api_key
         return ChatOpenAI(
             temperature=0.2,
             model_name="gpt-3.5-turbo",
-            max_tokens=500
+            max_tokens=500,
+            openai_api_base=settings.LLM_API_BASE or None,
+            request_timeout=settings.LLM_REQUEST_TIMEOUT
         )
     elif llm_provider == 'gemini':
         # Implementation for Gemini API
@@ -39,130 +48,336 @@ def get_llm_client():
         )
     else:
         # Default to OpenAI
+        from langchain.chat_models import ChatOpenAI
         os.environ["OPENAI_API_KEY"] = api_key
         return ChatOpenAI(
             temperature=0.2,
             model_name="gpt-3.5-turbo",
-            max_tokens=500
+            max_tokens=500,
+            openai_api_base=settings.LLM_API_BASE or None,
+            request_timeout=settings.LLM_REQUEST_TIMEOUT
         )
 
+_llm_router = None
+
+def get_llm_router():
+    """Get the per-process router over the configured LLM providers"""
+    global _llm_router
+    if _llm_router is None:
+        from .llm_router import LLMRouter, Provider, CircuitBreaker
+        providers = [
+            Provider(name, get_llm_client, CircuitBreaker(
+                failure_threshold=settings.LLM_CIRCUIT_FAILURE_THRESHOLD,
+                reset_seconds=settings.LLM_CIRCUIT_RESET_SECONDS
+            ), max_in_flight=settings.LLM_MAX_IN_FLIGHT)
+            for name in settings.LLM_PROVIDERS
+        ]
+        _llm_router = LLMRouter(
+            providers,
+            hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+            hedge_min_samples=settings.LLM_HEDGE_MIN_SAMPLES,
+            timeout=settings.LLM_REQUEST_TIMEOUT
+        )
+    return _llm_router
+
 def get_embeddings_model():
-    """Get the embeddings model"""
-    llm_provider = settings.LLM_PROVIDER
+    """Get the embeddings model, batching concurrent queries if enabled"""
+    if not settings.EMBEDDING_BATCH_QUERIES:
+        return create_embeddings_model()
+    
+    from .dispatcher import get_dispatcher, DispatchedEmbeddings
+    dispatcher = get_dispatcher(
+        settings.EMBEDDING_PROVIDER,
+        create_embeddings_model,
+        max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+        max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE
+    )
+    return DispatchedEmbeddings(dispatcher.embeddings, dispatcher)
+
+def create_embeddings_model():
+    """Create the embeddings model based on configuration"""
+    embedding_provider = settings.EMBEDDING_PROVIDER
     api_key = settings.LLM_API_KEY
     
-    if llm_provider == 'openai':
-        os.environ["OPENAI_API_KEY"] = api_key
-        return OpenAIEmbeddings()
+    if embedding_provider == 'local':
+        # Offline CPU model; no network calls for chunks or queries
+        from .embeddings import LocalEmbeddings
+        return LocalEmbeddings(
+            model_path=settings.LOCAL_EMBEDDING_MODEL_PATH,
+            max_batch_size=settings.LOCAL_EMBEDDING_MAX_BATCH_SIZE,
+            max_batch_chars=settings.LOCAL_EMBEDDING_MAX_BATCH_CHARS,
+            num_threads=settings.LOCAL_EMBEDDING_THREADS
+        )
     else:
         # Default to OpenAI embeddings
+        from langchain.embeddings import OpenAIEmbeddings
         os.environ["OPENAI_API_KEY"] = api_key
-        return OpenAIEmbeddings()
+        return OpenAIEmbeddings(model=settings.OPENAI_EMBEDDING_MODEL, openai_api_base=settings.LLM_API_BASE or None)
+
+def get_embeddings_model_key():
+    """Identify the configured embedding model, so cached vectors are never mixed across models"""
+    if settings.EMBEDDING_PROVIDER == 'local':
+        return f"local:{os.path.basename(os.path.normpath(settings.LOCAL_EMBEDDING_MODEL_PATH))}"
+    return f"openai:{settings.OPENAI_EMBEDDING_MODEL}"
+
+# Output size of the OpenAI embedding models, so bundles can be checked without calling the API
+OPENAI_EMBEDDING_DIMENSIONS = {
+    'text-embedding-ada-002': 1536,
+    'text-embedding-3-small': 1536,
+    'text-embedding-3-large': 3072,
+}
+
+def get_embeddings_dimension():
+    """Vector size of the configured embedding model without calling it, or None if unknown.
+
+    A local model's size is read from its sentence-transformers module configs on disk.
+    """
+    if settings.EMBEDDING_PROVIDER != 'local':
+        return OPENAI_EMBEDDING_DIMENSIONS.get(settings.OPENAI_EMBEDDING_MODEL)
+    
+    model_path = settings.LOCAL_EMBEDDING_MODEL_PATH
+    try:
+        with open(os.path.join(model_path, 'modules.json'), 'r', encoding='utf-8') as file:
+            modules = json.load(file)
+    except (OSError, ValueError):
+        return None
+    dimension = None
+    for module in modules:
+        try:
+            with open(os.path.join(model_path, module.get('path', ''), 'config.json'), 'r', encoding='utf-8') as file:
+                config = json.load(file)
+        except (OSError, ValueError):
+            continue
+        # Pooling sets the size; any Dense layers after it project to a new one
+        if module.get('type', '').endswith('.Pooling'):
+            dimension = config.get('word_embedding_dimension', dimension)
+        elif module.get('type', '').endswith('.Dense'):
+            dimension = config.get('out_features', dimension)
+    return dimension
+
+def get_content_text(content):
+    """Text to index for a content item"""
+    text = ""
+    if content.content_type == 'text':
+        # Read text file
+        try:
+            with open(content.file.path, 'r', encoding='utf-8') as file:
+                text = file.read()
+        except FileNotFoundError:
+            # A background move finished after this row was loaded; follow it to the new path
+            content.refresh_from_db(fields=['file'])
+            with open(content.file.path, 'r', encoding='utf-8') as file:
+                text = file.read()
+    elif content.content_type == 'pdf':
+        # Use extracted text
+        text = content.extracted_text
+    elif content.content_type == 'link':
+        # Use description and the fetched page text as context
+        text = f"Web Link: {content.web_link}\n{content.description or ''}"
+        if content.extracted_text:
+            text = f"{text}\n\n{content.extracted_text}"
+    else:
+        # For images and videos, use the description
+        text = content.description
+    return text
 
 def create_vector_store(user):
     """Create or update vector store for user's content"""
+    import numpy as np
+    from langchain.vectorstores import FAISS
+    from .chunking import get_chunker
+    from .embedding_cache import EmbeddingCache, text_key
+    
     # Get all content for the user
     contents = Content.objects.filter(user=user)
     
     # Get all texts from content
     documents = []
     for content in contents:
-        text = ""
-        if content.content_type == 'text':
-            # Read text file
-            with open(content.file.path, 'r', encoding='utf-8') as file:
-                text = file.read()
-        elif content.content_type == 'pdf':
-            # Use extracted text
-            text = content.extracted_text
-        elif content.content_type == 'link':
-            # Use description as context
-            text = f"Web Link: {content.web_link}\n{content.description}"
-        else:
-            # For images and videos, use the description
-            text = content.description
-        
+        text = get_content_text(content)
         if text:
             documents.append({
                 "page_content": text,
-                "metadata": {
-                    "id": content.id,
-                    "title": content.title,
-                    "type": content.content_type,
-                    "folder": content.folder.name if content.folder else "Uncategorized"
-                }
+                "content_id": content.id,
+                "type": content.content_type
             })
     
     if not documents:
         return None
     
-    # Create text splitter
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
-    )
-    
-    # Split documents
-    texts = []
-    metadatas = []
+    # Reuse chunks and vectors for documents we have already embedded (e.g. identical uploads).
+    # Each content type has its own chunker, so the chunker is part of the key.
+    cache = EmbeddingCache(get_embeddings_model_key())
+    embedded = {}
+    missing = {}
     for doc in documents:
-        chunks = text_splitter.split_text(doc["page_content"])
-        for chunk in chunks:
-            texts.append(chunk)
-            metadatas.append(doc["metadata"])
+        chunker = get_chunker(doc["type"])
+        key = doc["cache_key"] = text_key(doc["page_content"], chunker.key)
+        if key in embedded or key in missing:
+            continue
+        cached = cache.get(key)
+        if cached is not None:
+            embedded[key] = cached
+        else:
+            missing[key] = chunker.split(doc["page_content"])
     
-    # Create embeddings
+    # Create embeddings for anything not cached, in one batch
     embeddings = get_embeddings_model()
+    missing_chunks = [chunk for chunks in missing.values() for chunk in chunks]
+    vectors = embeddings.embed_documents(missing_chunks) if missing_chunks else []
+    offset = 0
+    for key, chunks in missing.items():
+        doc_vectors = vectors[offset:offset + len(chunks)]
+        offset += len(chunks)
+        cache.put(key, chunks, doc_vectors)
+        embedded[key] = (chunks, doc_vectors)
+    
+    # Collect chunks per document; each chunk only records its content id
+    text_embeddings = []
+    content_ids = []
+    for doc in documents:
+        chunks, doc_vectors = embedded[doc["cache_key"]]
+        for chunk, vector in zip(chunks, doc_vectors):
+            text_embeddings.append((chunk, vector))
+            content_ids.append(doc["content_id"])
+    
+    if not text_embeddings:
+        return None
     
     # Create vector store
-    vector_store = FAISS.from_texts(texts=texts, embedding=embeddings, metadatas=metadatas)
+    vector_store = FAISS.from_embeddings(text_embeddings=text_embeddings, embedding=embeddings)
+    vector_store.content_ids = np.asarray(content_ids, dtype=np.int64)
+    vector_store.embedding_keys = {doc["cache_key"] for doc in documents}
     
-    # Save vector store
-    vector_store_path = os.path.join(settings.MEDIA_ROOT, 'vectorstores', f"user_{user.id}")
-    os.makedirs(os.path.dirname(vector_store_path), exist_ok=True)
-    vector_store.save_local(vector_store_path)
+    # Publish as a new snapshot; readers switch over atomically
+    version, _ = publish_snapshot(user.id, lambda path: save_vector_store(vector_store, path))
+    remember_loaded_store(user.id, version, vector_store)
     
     return vector_store
 
+# Current loaded index per user, least recently used first, so requests keep serving a
+# snapshot until a newer one is published without every tenant's index staying in memory
+_loaded_stores = OrderedDict()
+_loaded_stores_lock = threading.Lock()
+
+def get_loaded_store(user_id):
+    """(version, vector store) this worker has loaded for a user, or None"""
+    with _loaded_stores_lock:
+        loaded = _loaded_stores.get(user_id)
+        if loaded is not None:
+            _loaded_stores.move_to_end(user_id)
+        return loaded
+
+def remember_loaded_store(user_id, version, vector_store):
+    """Keep a user's newest loaded index, evicting the least recently used beyond the limit"""
+    with _loaded_stores_lock:
+        _loaded_stores[user_id] = (version, vector_store)
+        _loaded_stores.move_to_end(user_id)
+        while len(_loaded_stores) > settings.LOADED_INDEX_CACHE_SIZE:
+            _loaded_stores.popitem(last=False)
+
 def get_vector_store(user):
     """Get vector store for user"""
-    vector_store_path = os.path.join(settings.MEDIA_ROOT, 'vectorstores', f"user_{user.id}")
+    version, path = current_snapshot(user.id)
     
     # Check if vector store exists
-    if not os.path.exists(vector_store_path):
-        return create_vector_store(user)
+    if version is None:
+        return build_vector_store(user)
+    
+    loaded = get_loaded_store(user.id)
+    if loaded and loaded[0] == version:
+        return loaded[1]
     
-    # Load vector store
+    vector_store = load_vector_store(user.id, version, path)
+    if vector_store is None:
+        if loaded:
+            # Keep serving the snapshot we already have
+            return loaded[1]
+        return build_vector_store(user, stale_version=version)
+    return vector_store
+
+# Content id of each chunk, by position in the FAISS index
+CONTENT_IDS_FILE = 'content_ids.npy'
+
+def save_vector_store(vector_store, path):
+    """Write an index and its content id array into a snapshot directory"""
+    import numpy as np
+    from .embedding_cache import write_snapshot_keys
+    vector_store.save_local(path)
+    np.save(os.path.join(path, CONTENT_IDS_FILE), vector_store.content_ids)
+    if getattr(vector_store, 'embedding_keys', None) is not None:
+        # Lets prune_embedding_cache keep the cache entries this snapshot was built from
+        write_snapshot_keys(path, vector_store.embedding_keys)
+
+def load_vector_store(user_id, version, path):
+    """Load an index snapshot, or return None if it can't be read"""
+    import numpy as np
+    from langchain.vectorstores import FAISS
     embeddings = get_embeddings_model()
     try:
-        vector_store = FAISS.load_local(vector_store_path, embeddings)
-        return vector_store
-    except:
+        vector_store = FAISS.load_local(path, embeddings)
+        content_ids_path = os.path.join(path, CONTENT_IDS_FILE)
+        if os.path.exists(content_ids_path):
+            vector_store.content_ids = np.load(content_ids_path)
+        else:
+            # Older snapshots kept the content id in each chunk's metadata
+            vector_store.content_ids = np.asarray([
+                vector_store.docstore.search(vector_store.index_to_docstore_id[i]).metadata.get("id", -1)
+                for i in range(vector_store.index.ntotal)
+            ], dtype=np.int64)
+    except Exception:
+        logger.exception("Failed to load index snapshot %s for user %s", version, user_id)
+        return None
+    
+    remember_loaded_store(user_id, version, vector_store)
+    return vector_store
+
+def build_vector_store(user, stale_version=None):
+    """Build the user's index, with at most one builder per user across all workers"""
+    with index_build_lock(user.id, settings.INDEX_BUILD_LOCK_TIMEOUT):
+        # Another worker may have published between our caller's check and the lock,
+        # with or without us waiting; the pointer only moves forward, so any other
+        # version than the one our caller saw is newer. Use theirs instead of building again.
+        version, path = current_snapshot(user.id)
+        if version is not None and version != stale_version:
+            vector_store = load_vector_store(user.id, version, path)
+            if vector_store is not None:
+                metrics.increment("index_build.joined")
+                return vector_store
+        
+        metrics.increment("index_build.builds")
         return create_vector_store(user)
 
-def generate_response(user, query):
-    """Generate response using RAG architecture"""
-    # Get vector store
-    vector_store = get_vector_store(user)
-    
-    if not vector_store:
-        return "I don't have any knowledge to answer your question yet. Please add some content to your repository.", 0.0
-    
-    # Create retriever
-    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-    
-    # Get relevant documents
-    docs = retriever.get_relevant_documents(query)
+def search_vector_store(user_id, vector_store, query, k=5):
+    """Find the k nearest chunks, resolving their metadata from the content lookup table.
     
-    if not docs:
-        return "I couldn't find relevant information in my knowledge base to answer your question.", 0.2
+    Returns (docs, query embedding, chunk embeddings); the embeddings come from
+    the index, so scoring them needs no further embedding calls. Chunks of
+    content deleted since the index was built are dropped.
+    """
+    import numpy as np
+    from langchain.schema import Document
     
-    # Calculate confidence score based on similarity
-    confidence_score = calculate_confidence_score(docs, query)
+    query_embedding = np.asarray(get_embeddings_model().embed_query(query), dtype=np.float32)
+    _, indices = vector_store.index.search(query_embedding.reshape(1, -1), k)
+    lookup = get_content_lookup(user_id)
     
-    # Create prompt template
-    prompt_template = """
+    docs = []
+    doc_embeddings = []
+    for i in indices[0]:
+        if i < 0:
+            continue
+        content_id = int(vector_store.content_ids[i])
+        if content_id not in lookup:
+            continue
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[i])
+        docs.append(Document(page_content=doc.page_content, metadata=dict(lookup[content_id], id=content_id)))
+        doc_embeddings.append(vector_store.index.reconstruct(int(i)))
+    return docs, query_embedding, doc_embeddings
+
+EARLY_EXIT_RESPONSE = "I'm sorry, that doesn't appear to be covered in my materials. I've passed your question on to your instructor."
+
+PROMPT_TEMPLATE = """
     You are an AI assistant for an educational institution. Use the following pieces of context to answer the question at the end.
     If you don't know the answer, just say "I don't know" or "I don't have enough information about that", don't try to make up an answer.
     
@@ -173,42 +388,61 @@ def generate_response(user, query):
     
     Answer:
     """
+
+def generate_response(user, query, config=None):
+    """Generate response using RAG architecture.
     
-    prompt = PromptTemplate(
-        template=prompt_template,
-        input_variables=["context", "question"]
-    )
+    Returns (answer, confidence score, name of the LLM provider that answered or None).
+    """
+    # Get vector store
+    vector_store = get_vector_store(user)
     
-    # Create chain
-    chain_type_kwargs = {"prompt": prompt}
-    llm = get_llm_client()
-    qa_chain = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=retriever,
-        chain_type_kwargs=chain_type_kwargs,
-        return_source_documents=False
-    )
+    if not vector_store:
+        return "I don't have any knowledge to answer your question yet. Please add some content to your repository.", 0.0, None
+    
+    # Get relevant documents
+    docs, query_embedding, doc_embeddings = search_vector_store(user.id, vector_store, query, k=5)
+    
+    if not docs:
+        return "I couldn't find relevant information in my knowledge base to answer your question.", 0.2, None
+    
+    # Calculate confidence score based on similarity
+    confidence_score = calculate_confidence_score(docs, query, query_embedding, doc_embeddings)
     
-    # Generate response
-    response = qa_chain({"query": query})
+    # Skip the LLM call when retrieval already shows we can't answer
+    if config is None:
+        config = ChatbotConfig.objects.filter(user=user).first()
+    if config and config.early_exit_enabled:
+        metrics.increment("early_exit.checked")
+        if confidence_score < config.early_exit_floor:
+            metrics.increment("early_exit.skipped")
+            return EARLY_EXIT_RESPONSE, confidence_score, None
+    
+    # Stuff the retrieved context into the prompt; the router picks the provider
+    prompt = PROMPT_TEMPLATE.format(
+        context="\n\n".join(doc.page_content for doc in docs),
+        question=query
+    )
+    answer, provider = get_llm_router().invoke(prompt)
     
-    return response["result"], confidence_score
+    return answer.strip(), confidence_score, provider
 
-def calculate_confidence_score(docs, query):
+def calculate_confidence_score(docs, query, query_embedding=None, doc_embeddings=None):
     """Calculate confidence score based on semantic similarity"""
     # This is a simple implementation; consider using cosine similarity with embeddings for more accuracy
     if not docs:
         return 0.0
     
-    # Get embeddings for query and documents
+    # Get embeddings for query and documents, unless retrieval already has them
     embeddings = get_embeddings_model()
-    query_embedding = embeddings.embed_query(query)
+    if query_embedding is None:
+        query_embedding = embeddings.embed_query(query)
+    if doc_embeddings is None:
+        doc_embeddings = embeddings.embed_documents([doc.page_content for doc in docs])
     
     # Calculate similarity scores
     scores = []
-    for doc in docs:
-        doc_embedding = embeddings.embed_query(doc.page_content)
+    for doc_embedding in doc_embeddings:
         similarity = cosine_similarity(query_embedding, doc_embedding)
         scores.append(similarity)
     
@@ -220,4 +454,5 @@ def calculate_confidence_score(docs, query):
 
 def cosine_similarity(a, b):
     """Calculate cosine similarity between two vectors"""
+    import numpy as np
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
\ No newline at end of file
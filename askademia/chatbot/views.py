@@ -1,7 +1,7 @@
 import json
 import uuid
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
@@ -10,6 +10,9 @@ from django.contrib.auth.models import User
 from .models import ChatbotConfig, ChatSession, ChatMessage, KnowledgeGap
 from .forms import ChatbotConfigForm
 from .utils import generate_response, calculate_confidence_score
+from . import metrics
+from .locks import IndexWarmingUp
+from .llm_router import LLMUnavailable
 from repo.models import Content, Folder
 
 @login_required
@@ -140,19 +143,21 @@ def chat_api(request):
             content=message
         )
         
+        config = ChatbotConfig.objects.get(user=user)
+        
         # Generate response using RAG
-        response_text, confidence = generate_response(user, message)
+        response_text, confidence, llm_provider = generate_response(user, message, config=config)
         
         # Save assistant message
         assistant_message = ChatMessage.objects.create(
             session=session,
             message_type='assistant',
             content=response_text,
-            confidence_score=confidence
+            confidence_score=confidence,
+            llm_provider=llm_provider
         )
         
         # Check if this is a knowledge gap
-        config = ChatbotConfig.objects.get(user=user)
         if confidence < config.confidence_threshold:
             gap = KnowledgeGap.objects.create(
                 user=user,
@@ -167,6 +172,17 @@ def chat_api(request):
             'session_id': session_id
         })
         
+    except IndexWarmingUp:
+        response = JsonResponse({
+            'error': 'The assistant is still warming up. Please try again in a moment.',
+            'warming_up': True
+        }, status=503)
+        response['Retry-After'] = '5'
+        return response
+    except LLMUnavailable:
+        return JsonResponse({
+            'error': 'The assistant is temporarily unavailable. Please try again shortly.'
+        }, status=503)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -211,4 +227,13 @@ def chatbot_widget(request, username):
         })
         
     except (User.DoesNotExist, ChatbotConfig.DoesNotExist):
-        return JsonResponse({'error': 'Chatbot not found'}, status=404)
\ No newline at end of file
+        return JsonResponse({'error': 'Chatbot not found'}, status=404)
+
+@user_passes_test(lambda u: u.is_staff)
+def metrics_api(request):
+    """Expose this worker's in-process metrics"""
+    data = metrics.snapshot()
+    counters = data["counters"]
+    checked = counters.get("early_exit.checked", 0)
+    data["early_exit_skip_rate"] = counters.get("early_exit.skipped", 0) / checked if checked else 0.0
+    return JsonResponse(data)
\ No newline at end of file
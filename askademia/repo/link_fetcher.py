@@ -0,0 +1,256 @@
+import time
+import codecs
+import socket
+import asyncio
+import logging
+import ipaddress
+from html.parser import HTMLParser
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
+from urllib.request import HTTPHandler, HTTPRedirectHandler, HTTPSHandler, Request, build_opener
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from .models import Content
+
+logger = logging.getLogger(__name__)
+
+class PageTextExtractor(HTMLParser):
+    """Pulls readable text out of HTML, keeping headings and paragraph breaks"""
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'head', 'nav', 'footer'}
+    BLOCK_TAGS = {'p', 'div', 'section', 'article', 'main', 'li', 'tr', 'br', 'pre', 'blockquote',
+                  'ul', 'ol', 'table', 'header', 'aside', 'figure', 'dd', 'dt'}
+    HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self.current = []
+        self.skip_depth = 0
+        self.heading_level = 0
+
+    def flush(self):
+        text = ' '.join(''.join(self.current).split())
+        if text:
+            # Markdown-style headings let the structured chunker keep sections together
+            self.blocks.append(f"{'#' * self.heading_level} {text}" if self.heading_level else text)
+        self.current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.HEADING_TAGS:
+            self.flush()
+            self.heading_level = int(tag[1])
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.HEADING_TAGS:
+            self.flush()
+            self.heading_level = 0
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.current.append(data)
+
+def extract_text(html):
+    """Readable text of an HTML page, one paragraph per block"""
+    parser = PageTextExtractor()
+    parser.feed(html)
+    parser.close()
+    parser.flush()
+    return '\n\n'.join(parser.blocks)
+
+def is_public_address(address):
+    """Whether an IP address is globally routable (not private, loopback, link-local, ...)"""
+    ip = ipaddress.ip_address(address.split('%')[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+def is_allowed_host(host):
+    return host.lower() in settings.LINK_FETCH_ALLOWED_HOSTS
+
+def check_url(url):
+    """Raise URLError unless url is http(s) on a host that resolves only to public addresses.
+
+    Links are supplied by instructors and their text becomes answerable through
+    the public widget, so internal services must never be reachable this way.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https'):
+        raise URLError(f"Unsupported URL scheme {parts.scheme!r}")
+    host = parts.hostname
+    if not host:
+        raise URLError("URL has no host")
+    if is_allowed_host(host):
+        return
+    try:
+        addresses = socket.getaddrinfo(host, parts.port or 80, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise URLError(e)
+    for *_, sockaddr in addresses:
+        if not is_public_address(sockaddr[0]):
+            raise URLError(f"{host} resolves to non-public address {sockaddr[0]}")
+
+def create_checked_connection(address, *args, **kwargs):
+    # Check the address actually connected to as well, so DNS changes after check_url don't slip through
+    sock = socket.create_connection(address, *args, **kwargs)
+    peer = sock.getpeername()[0]
+    if not (is_allowed_host(address[0]) or is_allowed_host(peer) or is_public_address(peer)):
+        sock.close()
+        raise URLError(f"{address[0]} connected to non-public address {peer}")
+    return sock
+
+class CheckedHTTPConnection(HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_checked_connection
+
+class CheckedHTTPSConnection(HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_checked_connection
+
+class CheckedHTTPHandler(HTTPHandler):
+    def http_open(self, req):
+        return self.do_open(CheckedHTTPConnection, req)
+
+class CheckedHTTPSHandler(HTTPSHandler):
+    def https_open(self, req):
+        return self.do_open(CheckedHTTPSConnection, req, context=self._context)
+
+class CheckedRedirectHandler(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+# Replaces urllib's default http(s) and redirect handlers with the checked ones
+_opener = build_opener(CheckedHTTPHandler, CheckedHTTPSHandler, CheckedRedirectHandler)
+
+def page_charset(response):
+    """The response's declared charset, or utf-8 when it is missing or unknown"""
+    charset = response.headers.get_content_charset()
+    if charset:
+        try:
+            return codecs.lookup(charset).name
+        except LookupError:
+            pass
+    return 'utf-8'
+
+def fetch_page(url, etag=None, last_modified=None):
+    """Conditionally fetch a page.
+
+    Returns a dict with status (0 on network errors and blocked URLs), and for
+    a 200 the extracted text plus the ETag/Last-Modified validators to send next time.
+    """
+    headers = {'User-Agent': settings.LINK_FETCH_USER_AGENT, 'Accept': 'text/html, text/plain;q=0.9'}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+
+    try:
+        check_url(url)
+        with _opener.open(Request(url, headers=headers), timeout=settings.LINK_FETCH_TIMEOUT) as response:
+            content_type = response.headers.get_content_type()
+            if content_type not in ('text/html', 'text/plain', 'application/xhtml+xml'):
+                return {'status': response.status, 'error': f"Unsupported content type {content_type}"}
+            body = response.read(settings.LINK_FETCH_MAX_BYTES)
+            text = body.decode(page_charset(response), errors='replace')
+            return {
+                'status': response.status,
+                'text': text.strip() if content_type == 'text/plain' else extract_text(text),
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+            }
+    except HTTPError as e:
+        if e.code == 304:
+            return {'status': 304}
+        return {'status': e.code, 'error': str(e)}
+    except (URLError, OSError, ValueError, HTTPException) as e:
+        return {'status': 0, 'error': str(e) or type(e).__name__}
+
+async def fetch_pages(items, concurrency=None, host_delay=None):
+    """Fetch many pages with bounded concurrency and a minimum delay between hits on one host.
+
+    items is a list of (key, url, etag, last_modified); returns {key: result}.
+    """
+    concurrency = concurrency or settings.LINK_FETCH_CONCURRENCY
+    host_delay = settings.LINK_FETCH_HOST_DELAY if host_delay is None else host_delay
+    semaphore = asyncio.Semaphore(concurrency)
+    host_locks = {}
+    host_last_request = {}
+    results = {}
+
+    async def fetch_one(key, url, etag, last_modified):
+        host = urlsplit(url).netloc.lower()
+        lock = host_locks.setdefault(host, asyncio.Lock())
+        # One request at a time per host, spaced by host_delay
+        async with lock:
+            wait = host_last_request.get(host, 0) + host_delay - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with semaphore:
+                try:
+                    results[key] = await asyncio.to_thread(fetch_page, url, etag, last_modified)
+                except Exception as e:
+                    # One bad page must not abort the batch for everyone else
+                    logger.exception("Unexpected error fetching %s", url)
+                    results[key] = {'status': 0, 'error': str(e) or type(e).__name__}
+            host_last_request[host] = time.monotonic()
+
+    await asyncio.gather(*(fetch_one(*item) for item in items))
+    return results
+
+def refresh_links(contents=None, max_age=None, force=False, concurrency=None):
+    """Fetch or revalidate web-link content and store the page text in extracted_text.
+
+    Unchanged pages cost one conditional request (304) and leave extracted_text
+    as is, so the index reuses their cached embeddings. Returns a summary dict
+    including the ids of users whose pages changed.
+    """
+    contents = Content.objects.filter(content_type='link') if contents is None else contents
+    contents = contents.exclude(web_link__isnull=True).exclude(web_link='')
+    if not force:
+        max_age = settings.LINK_REFRESH_MAX_AGE if max_age is None else max_age
+        cutoff = timezone.now() - max_age
+        contents = contents.filter(Q(link_fetched_at__isnull=True) | Q(link_fetched_at__lt=cutoff))
+    rows = list(contents.only('id', 'user', 'web_link', 'extracted_text', 'link_etag', 'link_last_modified'))
+
+    items = [
+        (content.pk, content.web_link, None if force else content.link_etag, None if force else content.link_last_modified)
+        for content in rows
+    ]
+    results = asyncio.run(fetch_pages(items, concurrency=concurrency))
+
+    summary = {'fetched': 0, 'not_modified': 0, 'changed': 0, 'failed': 0, 'changed_users': set()}
+    now = timezone.now()
+    for content in rows:
+        result = results[content.pk]
+        status = result['status']
+        if status == 304:
+            summary['not_modified'] += 1
+            Content.objects.filter(pk=content.pk).update(link_fetched_at=now)
+        elif status == 200 and 'text' in result:
+            summary['fetched'] += 1
+            changes = {
+                'link_fetched_at': now,
+                'link_etag': result['etag'],
+                'link_last_modified': result['last_modified'],
+            }
+            if result['text'] != (content.extracted_text or ''):
+                changes['extracted_text'] = result['text']
+                summary['changed'] += 1
+                summary['changed_users'].add(content.user_id)
+            Content.objects.filter(pk=content.pk).update(**changes)
+        else:
+            summary['failed'] += 1
+            logger.warning("Fetching %s failed: %s", content.web_link, result.get('error', status))
+    return summary
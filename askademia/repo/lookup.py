@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import Content
+
+def _cache_key(user_id):
+    return f"content_lookup:{user_id}"
+
+def get_content_lookup(user_id):
+    """Map of content id -> title, type and folder name for a user, cached"""
+    lookup = cache.get(_cache_key(user_id))
+    if lookup is None:
+        contents = (
+            Content.objects.filter(user_id=user_id)
+            .select_related('folder')
+            .only('id', 'title', 'content_type', 'folder__name')
+        )
+        lookup = {
+            content.id: {
+                "title": content.title,
+                "type": content.content_type,
+                "folder": content.folder.name if content.folder else "Uncategorized"
+            }
+            for content in contents
+        }
+        cache.set(_cache_key(user_id), lookup, settings.CONTENT_LOOKUP_CACHE_SECONDS)
+    return lookup
+
+def invalidate_content_lookup(user_id):
+    cache.delete(_cache_key(user_id))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from repo.models import Folder
+
+class Command(BaseCommand):
+    help = "Recompute materialized folder tree paths from parent links"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Only rebuild this user's folders")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['username']:
+            user = User.objects.get(username=options['username'])
+        count = Folder.rebuild_tree_paths(user=user)
+        self.stdout.write(self.style.SUCCESS(f"Updated tree paths for {count} folders"))
@@ -0,0 +1,37 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from repo.models import Content
+from repo.link_fetcher import refresh_links
+
+class Command(BaseCommand):
+    help = "Fetch or revalidate the pages behind web-link content (run periodically, e.g. from cron)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help="Only refresh this user's links")
+        parser.add_argument('--max-age-hours', type=float, help="Revalidate links fetched longer ago than this")
+        parser.add_argument('--force', action='store_true', help="Refetch everything, ignoring ETag/Last-Modified")
+        parser.add_argument('--concurrency', type=int, help="Simultaneous fetches across all hosts")
+        parser.add_argument('--no-rebuild', action='store_true', help="Don't rebuild indexes for users whose pages changed")
+
+    def handle(self, *args, **options):
+        contents = Content.objects.filter(content_type='link')
+        if options['username']:
+            try:
+                contents = contents.filter(user=User.objects.get(username=options['username']))
+            except User.DoesNotExist:
+                raise CommandError(f"User {options['username']} not found")
+        max_age = timedelta(hours=options['max_age_hours']) if options['max_age_hours'] is not None else None
+
+        summary = refresh_links(contents, max_age=max_age, force=options['force'], concurrency=options['concurrency'])
+        self.stdout.write(
+            f"Fetched {summary['fetched']} ({summary['changed']} changed), "
+            f"{summary['not_modified']} not modified, {summary['failed']} failed"
+        )
+
+        if not options['no_rebuild']:
+            # Unchanged documents come from the embedding cache, so only changed pages are embedded
+            from chatbot.utils import build_vector_store
+            for user in User.objects.filter(pk__in=summary['changed_users']):
+                build_vector_store(user)
+                self.stdout.write(f"Rebuilt index for {user.username}")
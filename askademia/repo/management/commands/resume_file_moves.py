@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from repo.relocation import resume_moves
+
+class Command(BaseCommand):
+    help = "Retry file moves left pending or failed by an interrupted bulk relocation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-attempts', type=int, help="Skip moves that already failed this many times")
+
+    def handle(self, *args, **options):
+        count = resume_moves(max_attempts=options['max_attempts'])
+        self.stdout.write(self.style.SUCCESS(f"Processed {count} file moves"))
@@ -1,6 +1,7 @@
 import os
 import uuid
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Q
 from django.contrib.auth.models import User
 
 def get_file_path(instance, filename):
@@ -10,6 +11,11 @@ def get_file_path(instance, filename):
     folder = instance.folder.folder_path if instance.folder else 'uncategorized'
     return os.path.join('repository', folder, filename)
 
+def get_blob_path(instance, filename):
+    """Content-addressed path for a stored blob, sharded by hash prefix"""
+    ext = filename.split('.')[-1] if '.' in filename else 'bin'
+    return os.path.join('repository', 'blobs', instance.sha256[:2], f"{instance.sha256}.{ext}")
+
 class Folder(models.Model):
     """Repository folder for organizing content"""
     name = models.CharField(max_length=255)
@@ -17,11 +23,176 @@ class Folder(models.Model):
     folder_path = models.CharField(max_length=255, unique=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, blank=True, null=True, related_name='children')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='folders')
+    # Materialized path of ancestor ids, e.g. "/3/8/" for a folder under 8 under 3, or "/" at
+    # the root. Empty only for rows created before the field existed and not yet backfilled.
+    tree_path = models.CharField(max_length=1024, db_index=True, blank=True, default='')
+    depth = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     def __str__(self):
         return self.name
+    
+    @property
+    def subtree_path(self):
+        """Prefix shared by the tree paths of every folder below this one"""
+        return f"{self.tree_path}{self.pk}/"
+    
+    def _walk_path(self):
+        # Tree path and depth from parent links, for rows that have not been backfilled
+        ids = []
+        folder = self
+        while folder.parent_id:
+            if folder.parent_id == self.pk or folder.parent_id in ids:
+                raise ValueError(f"Folder {self.pk} is part of a cycle.")
+            ids.append(folder.parent_id)
+            folder = folder.parent
+        return '/' + ''.join(f"{pk}/" for pk in reversed(ids)), len(ids)
+    
+    def _parent_path(self):
+        if not self.parent_id:
+            return '/', 0
+        parent = self.parent
+        parent_path, parent_depth = (parent.tree_path, parent.depth) if parent.tree_path else parent._walk_path()
+        return f"{parent_path}{parent.pk}/", parent_depth + 1
+    
+    def save(self, *args, **kwargs):
+        """Override save to maintain the materialized tree path"""
+        tree_path, depth = self._parent_path()
+        
+        if not self.pk:
+            # Only ancestor ids are stored, so the path is known before the insert
+            self.tree_path, self.depth = tree_path, depth
+            super().save(*args, **kwargs)
+            return
+        
+        if not self.tree_path:
+            # A legacy row: save it, then backfill this user's whole tree from parent links
+            super().save(*args, **kwargs)
+            Folder.rebuild_tree_paths(user=self.user_id)
+            self.tree_path, self.depth = Folder.objects.filter(pk=self.pk).values_list('tree_path', 'depth').get()
+            return
+        
+        if tree_path == self.tree_path:
+            super().save(*args, **kwargs)
+            return
+        
+        if self.parent_id == self.pk or tree_path.startswith(self.subtree_path):
+            raise ValueError("A folder cannot be moved into its own subtree.")
+        
+        # Moved: rewrite the paths of the whole subtree. Siblings share a path, so this
+        # is one fetch plus one UPDATE per folder that has children, rather than per
+        # descendant; a single UPDATE with string functions wouldn't translate on djongo.
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'tree_path', 'depth'}
+        old_prefix = self.subtree_path
+        depth_change = depth - self.depth
+        with transaction.atomic():
+            old_paths = set(self.get_descendants().values_list('tree_path', 'depth'))
+            self.tree_path, self.depth = tree_path, depth
+            super().save(*args, **kwargs)
+            new_prefix = self.subtree_path
+            for old_path, old_depth in old_paths:
+                Folder.objects.filter(user_id=self.user_id, tree_path=old_path).update(
+                    tree_path=new_prefix + old_path[len(old_prefix):], depth=old_depth + depth_change
+                )
+    
+    def delete(self, *args, **kwargs):
+        """Delete the folder and its whole subtree"""
+        return self.get_descendants(include_self=True).delete()
+    
+    def move_to(self, new_parent):
+        """Move this folder (and its subtree) under new_parent, or to the root"""
+        self.parent = new_parent
+        self.save()
+    
+    def _walk_descendant_ids(self):
+        # One query per level, for rows that have not been backfilled
+        ids = []
+        level = [self.pk]
+        while level:
+            level = list(Folder.objects.filter(user_id=self.user_id, parent_id__in=level).values_list('pk', flat=True))
+            level = [pk for pk in level if pk not in ids and pk != self.pk]
+            ids.extend(level)
+        return ids
+    
+    def get_descendants(self, include_self=False):
+        """All of this user's folders below this one, in a single query"""
+        if not self.tree_path:
+            ids = self._walk_descendant_ids()
+            return Folder.objects.filter(user_id=self.user_id, pk__in=(ids + [self.pk]) if include_self else ids)
+        subtree = Q(tree_path__startswith=self.subtree_path)
+        if include_self:
+            subtree |= Q(pk=self.pk)
+        return Folder.objects.filter(subtree, user_id=self.user_id)
+    
+    def get_ancestors(self):
+        """Folders above this one, from the root down"""
+        tree_path = self.tree_path or self._walk_path()[0]
+        ids = [int(pk) for pk in tree_path.strip('/').split('/') if pk]
+        return Folder.objects.filter(user_id=self.user_id, pk__in=ids).order_by('depth')
+    
+    def subtree_contents(self):
+        """All content in this folder and its subfolders, in a single query"""
+        if not self.tree_path:
+            return Content.objects.filter(user_id=self.user_id, folder_id__in=[self.pk] + self._walk_descendant_ids())
+        return Content.objects.filter(
+            Q(folder_id=self.pk) | Q(folder__tree_path__startswith=self.subtree_path),
+            user_id=self.user_id
+        )
+    
+    def subtree_content_count(self):
+        return self.subtree_contents().count()
+    
+    @staticmethod
+    def _write_tree_paths(folders):
+        # Plain per-row updates; djongo can't translate the CASE WHEN that bulk_update emits
+        with transaction.atomic():
+            for folder in folders:
+                Folder.objects.filter(pk=folder.pk).update(tree_path=folder.tree_path, depth=folder.depth)
+    
+    @classmethod
+    def rebuild_tree_paths(cls, user=None):
+        """Recompute tree paths from parent links (backfill or repair); returns the number changed"""
+        folders = cls.objects.all()
+        if user is not None:
+            folders = folders.filter(user=user)
+        folders = {folder.pk: folder for folder in folders}
+        resolved = {}
+        
+        def resolve(folder, seen=()):
+            if folder.pk in resolved:
+                return resolved[folder.pk]
+            if folder.pk in seen:
+                raise ValueError(f"Folder {folder.pk} is part of a cycle.")
+            parent = folders.get(folder.parent_id)
+            if parent is None:
+                resolved[folder.pk] = ('/', 0)
+            else:
+                parent_path, depth = resolve(parent, seen + (folder.pk,))
+                resolved[folder.pk] = (f"{parent_path}{parent.pk}/", depth + 1)
+            return resolved[folder.pk]
+        
+        changed = []
+        for folder in folders.values():
+            tree_path, depth = resolve(folder)
+            if (folder.tree_path, folder.depth) != (tree_path, depth):
+                folder.tree_path, folder.depth = tree_path, depth
+                changed.append(folder)
+        cls._write_tree_paths(changed)
+        return len(changed)
+
+class StoredBlob(models.Model):
+    """Uploaded bytes stored once by SHA-256 and shared by every Content that uses them"""
+    sha256 = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to=get_blob_path)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    extracted_text = models.TextField(blank=True, null=True)  # Shared so identical uploads are only extracted once
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return self.sha256
 
 class Content(models.Model):
     """Repository content item (file or web link)"""
@@ -38,7 +209,12 @@ class Content(models.Model):
     content_type = models.CharField(max_length=10, choices=CONTENT_TYPES)
     file = models.FileField(upload_to=get_file_path, blank=True, null=True)
     web_link = models.URLField(blank=True, null=True)
+    # Validators from the last fetch of web_link, for conditional refreshes
+    link_etag = models.CharField(max_length=255, blank=True, null=True)
+    link_last_modified = models.CharField(max_length=64, blank=True, null=True)
+    link_fetched_at = models.DateTimeField(blank=True, null=True)
     extracted_text = models.TextField(blank=True, null=True)
+    blob = models.ForeignKey(StoredBlob, on_delete=models.PROTECT, related_name='contents', null=True, blank=True)
     folder = models.ForeignKey(Folder, on_delete=models.CASCADE, related_name='contents', null=True, blank=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='contents')
     vector_id = models.CharField(max_length=255, blank=True, null=True)
@@ -48,11 +224,42 @@ class Content(models.Model):
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored folder, blob and text so save() can detect changes without re-fetching the row
+        loaded = dict(zip(field_names, values))
+        instance._loaded_folder_id = loaded.get('folder_id')
+        instance._loaded_blob_id = loaded.get('blob_id')
+        instance._loaded_extracted_text = loaded.get('extracted_text')
+        return instance
+    
+    def _extracted_text_changed(self):
+        if 'extracted_text' in self.get_deferred_fields():
+            return False
+        return self.extracted_text != getattr(self, '_loaded_extracted_text', None)
+    
     def save(self, *args, **kwargs):
-        """Override save to handle file path changes"""
-        if self.pk:
-            old_instance = Content.objects.get(pk=self.pk)
-            if old_instance.folder != self.folder and self.file:
+        """Override save to deduplicate uploads and handle file path changes"""
+        from .storage import store_upload, release_blob, share_extracted_text
+        
+        loaded_blob_id = getattr(self, '_loaded_blob_id', None)
+        stored_upload = False
+        if self.file and not self.file._committed:
+            # New upload: store it by content hash instead of under a fresh name
+            self.blob = store_upload(self.file)
+            self.file = self.blob.file.name
+            stored_upload = True
+        elif not self.file:
+            self.blob = None
+        # Only look at the blob when there is something to share, so plain saves stay one query
+        if self.blob_id and (stored_upload or self._state.adding or self._extracted_text_changed()):
+            share_extracted_text(self)
+        
+        try:
+            loaded_folder_id = getattr(self, '_loaded_folder_id', self.folder_id)
+            if self.pk and self.file and not self.blob_id and loaded_folder_id != self.folder_id:
+                # Blob-backed files are shared, so only legacy per-folder files move
                 old_file_path = self.file.path
                 self.file.name = get_file_path(self, os.path.basename(self.file.name))
                 super().save(*args, **kwargs)
@@ -60,5 +267,37 @@ class Content(models.Model):
                     new_file_path = self.file.path
                     os.makedirs(os.path.dirname(new_file_path), exist_ok=True)
                     os.rename(old_file_path, new_file_path)
-                return
-        super().save(*args, **kwargs)
\ No newline at end of file
+            else:
+                super().save(*args, **kwargs)
+        except Exception:
+            if stored_upload:
+                # Give back the reference store_upload took for this row
+                release_blob(self.blob_id)
+            raise
+        
+        if loaded_blob_id and loaded_blob_id != self.blob_id:
+            release_blob(loaded_blob_id)
+        self._loaded_folder_id = self.folder_id
+        self._loaded_blob_id = self.blob_id
+        self._loaded_extracted_text = self.extracted_text
+
+class FileMove(models.Model):
+    """A pending or finished file relocation, so bulk moves can resume after a failure"""
+    STATUSES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+        ('superseded', 'Superseded'),  # The content was relocated again before this move ran
+    ]
+    
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name='file_moves')
+    source_name = models.CharField(max_length=1024)
+    target_name = models.CharField(max_length=1024)
+    status = models.CharField(max_length=10, choices=STATUSES, default='pending', db_index=True)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Move {self.source_name} -> {self.target_name} ({self.status})"
\ No newline at end of file
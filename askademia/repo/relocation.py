@@ -0,0 +1,149 @@
+import os
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from .models import Content, FileMove, get_file_path
+from .lookup import invalidate_content_lookup
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Shared worker pool for background file moves"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.FILE_MOVE_WORKERS,
+                thread_name_prefix='file-move'
+            )
+        return _executor
+
+def relocate_contents(contents, target_folder):
+    """Move a selection of content into target_folder.
+
+    The folder change is a single bulk update; files are moved afterwards by
+    the worker pool, and unfinished moves from earlier relocations of the same
+    content are superseded. The index resolves folders at query time, so it needs no update.
+    Returns the number of content items moved.
+    """
+    target_id = target_folder.pk if target_folder else None
+    rows = list(contents.exclude(folder_id=target_id).only('id', 'file', 'blob', 'user', 'folder'))
+    if not rows:
+        return 0
+
+    moves = []
+    for content in rows:
+        if not content.file or content.blob_id:
+            # Content-addressed files are shared and never move
+            continue
+        content.folder = target_folder
+        target_name = get_file_path(content, os.path.basename(content.file.name))
+        if target_name != content.file.name:
+            moves.append(FileMove(content=content, source_name=content.file.name, target_name=target_name))
+
+    ids = [content.pk for content in rows]
+    with transaction.atomic():
+        Content.objects.filter(pk__in=ids).update(folder=target_folder, updated_at=timezone.now())
+        # Earlier moves that haven't finished would race the new ones for the same source file
+        FileMove.objects.filter(content_id__in=ids, status__in=['pending', 'failed']).update(
+            status='superseded', updated_at=timezone.now()
+        )
+        FileMove.objects.bulk_create(moves, batch_size=500)
+
+    transaction.on_commit(lambda: schedule_pending_moves([move.content_id for move in moves]))
+
+    # The index only stores content ids, so there is nothing to re-embed
+    for user_id in {content.user_id for content in rows}:
+        invalidate_content_lookup(user_id)
+
+    return len(rows)
+
+def relocate_folder_contents(folder, target_folder, include_subfolders=True):
+    """Move everything in folder (and optionally its subfolders) into target_folder"""
+    if include_subfolders:
+        contents = folder.subtree_contents()
+    else:
+        contents = Content.objects.filter(folder=folder)
+    return relocate_contents(contents, target_folder)
+
+def schedule_pending_moves(content_ids=None):
+    """Hand pending file moves to the worker pool"""
+    moves = FileMove.objects.filter(status='pending')
+    if content_ids is not None:
+        moves = moves.filter(content_id__in=content_ids)
+    move_ids = list(moves.values_list('id', flat=True))
+    executor = get_executor()
+    for move_id in move_ids:
+        executor.submit(run_move, move_id)
+    return len(move_ids)
+
+def resume_moves(max_attempts=None, background=False):
+    """Retry moves left pending or failed by an earlier run (e.g. after a crash)"""
+    max_attempts = max_attempts or settings.FILE_MOVE_MAX_ATTEMPTS
+    FileMove.objects.filter(status='failed', attempts__lt=max_attempts).update(status='pending')
+    if background:
+        return schedule_pending_moves()
+
+    move_ids = list(FileMove.objects.filter(status='pending').values_list('id', flat=True))
+    for move_id in move_ids:
+        run_move(move_id)
+    return len(move_ids)
+
+def link_or_copy(source, target):
+    """Make target a second name for source, copying where hard links aren't supported"""
+    try:
+        os.link(source, target)
+    except OSError:
+        # Copy under a temporary name so a half-written target is never picked up
+        tmp_target = f"{target}.tmp"
+        shutil.copy2(source, tmp_target)
+        os.replace(tmp_target, target)
+
+def run_move(move_id):
+    """Move one file and point its Content at the new location"""
+    close_old_connections()
+    try:
+        move = FileMove.objects.select_related('content').get(pk=move_id, status='pending')
+    except FileMove.DoesNotExist:
+        return
+
+    source = os.path.join(settings.MEDIA_ROOT, move.source_name)
+    target = os.path.join(settings.MEDIA_ROOT, move.target_name)
+    try:
+        # Link, repoint, then unlink: both paths stay readable until Content points at the target,
+        # so index builds never see a missing file. Each step is idempotent for retries.
+        if os.path.isfile(source):
+            if not os.path.isfile(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                link_or_copy(source, target)
+        elif not os.path.isfile(target):
+            raise FileNotFoundError(source)
+
+        with transaction.atomic():
+            # Claim the move before repointing, in case a later relocation superseded it meanwhile
+            claimed = FileMove.objects.filter(pk=move.pk, status='pending').update(
+                status='done', attempts=move.attempts + 1, error=None
+            )
+            if claimed:
+                Content.objects.filter(pk=move.content_id, file=move.source_name).update(file=move.target_name)
+        if not claimed:
+            # Nothing points at our copy; the source still belongs to the newer move
+            if os.path.isfile(source) and os.path.isfile(target):
+                os.remove(target)
+            return
+        if os.path.isfile(source):
+            os.remove(source)
+    except Exception as e:
+        logger.exception("File move %s failed", move.pk)
+        FileMove.objects.filter(pk=move.pk).exclude(status='superseded').update(
+            status='failed', attempts=move.attempts + 1, error=str(e)
+        )
+    finally:
+        close_old_connections()
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Content, Folder
+from .lookup import invalidate_content_lookup
+from .storage import release_blob
+
+@receiver(post_delete, sender=Content)
+def release_content_blob(sender, instance, **kwargs):
+    """Drop the deleted content's reference to its stored file"""
+    if instance.blob_id:
+        release_blob(instance.blob_id)
+
+@receiver(post_save, sender=Content)
+@receiver(post_delete, sender=Content)
+@receiver(post_save, sender=Folder)
+@receiver(post_delete, sender=Folder)
+def refresh_content_lookup(sender, instance, **kwargs):
+    """Titles and folder names are resolved at query time, so just drop the cached table"""
+    invalidate_content_lookup(instance.user_id)
@@ -0,0 +1,77 @@
+import hashlib
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import StoredBlob
+
+class HashingUploadMixin:
+    """Computes the SHA-256 of an upload while it streams in"""
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        if file is not None:
+            file.sha256 = self.hasher.hexdigest()
+        return file
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    pass
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    pass
+
+def hash_file(file):
+    """SHA-256 of a file, reusing the hash computed during upload when there is one"""
+    # Content.file is a FieldFile wrapping the uploaded file that carries the hash
+    sha256 = getattr(file, 'sha256', None) or getattr(getattr(file, 'file', None), 'sha256', None)
+    if sha256:
+        return sha256
+    hasher = hashlib.sha256()
+    file.seek(0)
+    for chunk in file.chunks():
+        hasher.update(chunk)
+    file.seek(0)
+    return hasher.hexdigest()
+
+def store_upload(file):
+    """Store an uploaded file by content hash and take a reference to it"""
+    sha256 = hash_file(file)
+    blob = StoredBlob.objects.filter(sha256=sha256).first()
+    if blob is None:
+        try:
+            with transaction.atomic():
+                blob = StoredBlob(sha256=sha256, size=file.size)
+                blob.file.save(file.name, file, save=False)
+                blob.save()
+        except IntegrityError:
+            # Another upload of the same bytes won the race; drop our copy and share theirs
+            blob.file.delete(save=False)
+            blob = StoredBlob.objects.get(sha256=sha256)
+    StoredBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+    return blob
+
+def release_blob(blob_id):
+    """Drop a reference to a blob, deleting it and its file once unused"""
+    StoredBlob.objects.filter(pk=blob_id, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    blob = StoredBlob.objects.filter(pk=blob_id, ref_count=0).first()
+    if blob is not None and not blob.contents.exists():
+        blob.file.delete(save=False)
+        blob.delete()
+
+def share_extracted_text(content):
+    """Reuse text already extracted from identical bytes, or publish ours to the blob"""
+    if not content.blob_id:
+        return
+    blob = content.blob
+    if not content.extracted_text and blob.extracted_text:
+        content.extracted_text = blob.extracted_text
+    elif content.extracted_text and not blob.extracted_text:
+        StoredBlob.objects.filter(pk=blob.pk, extracted_text__isnull=True).update(extracted_text=content.extracted_text)
+        blob.extracted_text = content.extracted_text
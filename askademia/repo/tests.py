@@ -1,3 +1,411 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+import threading
+from unittest import mock
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, connection
+from django.db.models import QuerySet
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from .models import Content, FileMove, Folder, StoredBlob
+from .relocation import relocate_contents, resume_moves, run_move
+from .link_fetcher import check_url, fetch_page, refresh_links
 
-# Create your tests here.
+class FolderTreeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='teacher', password='secret')
+        self.other = User.objects.create_user(username='other', password='secret')
+
+    def folder(self, name, parent=None, user=None):
+        user = user or self.user
+        return Folder.objects.create(name=name, folder_path=f"{user.username}/{name}", parent=parent, user=user)
+
+    def content(self, title, folder, user=None):
+        return Content.objects.create(
+            title=title, content_type='link', web_link='https://example.com/', folder=folder, user=user or self.user
+        )
+
+    def make_legacy(self, *folders):
+        # Rows created before tree_path existed
+        Folder.objects.filter(pk__in=[folder.pk for folder in folders]).update(tree_path='', depth=0)
+        for folder in folders:
+            folder.refresh_from_db()
+
+    def test_create_sets_path(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        grandchild = self.folder('grandchild', child)
+        self.assertEqual(root.tree_path, '/')
+        self.assertEqual(grandchild.tree_path, f"/{root.pk}/{child.pk}/")
+        self.assertEqual(grandchild.depth, 2)
+        grandchild.refresh_from_db()
+        self.assertEqual(grandchild.tree_path, f"/{root.pk}/{child.pk}/")
+        self.assertEqual(list(grandchild.get_ancestors()), [root, child])
+
+    def test_subtree_queries(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        sibling = self.folder('sibling')
+        inside = self.content('inside', child)
+        self.content('outside', sibling)
+        self.assertEqual(set(root.get_descendants()), {child})
+        self.assertEqual(set(root.get_descendants(include_self=True)), {root, child})
+        self.assertEqual(list(root.subtree_contents()), [inside])
+        self.assertEqual(root.subtree_content_count(), 1)
+
+    def test_move_rewrites_subtree(self):
+        a = self.folder('a')
+        b = self.folder('b')
+        child = self.folder('child', a)
+        grandchild = self.folder('grandchild', child)
+        child.move_to(b)
+        grandchild.refresh_from_db()
+        self.assertEqual(child.tree_path, f"/{b.pk}/")
+        self.assertEqual(grandchild.tree_path, f"/{b.pk}/{child.pk}/")
+        self.assertEqual(grandchild.depth, 2)
+        self.assertEqual(set(a.get_descendants()), set())
+        self.assertEqual(set(b.get_descendants()), {child, grandchild})
+
+    def test_move_updates_once_per_parent(self):
+        a = self.folder('a')
+        b = self.folder('b')
+        child = self.folder('child', a)
+        leaves = [self.folder(f"leaf {i}", child) for i in range(5)]
+        twigs = [self.folder(f"twig {i}", leaves[0]) for i in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            child.move_to(b)
+        updates = [query for query in queries if query['sql'].startswith('UPDATE')]
+        # The moved folder itself, then one per distinct parent below it
+        self.assertEqual(len(updates), 3)
+        for folder in leaves + twigs:
+            folder.refresh_from_db()
+        self.assertEqual({leaf.tree_path for leaf in leaves}, {f"/{b.pk}/{child.pk}/"})
+        self.assertEqual({twig.tree_path for twig in twigs}, {f"/{b.pk}/{child.pk}/{leaves[0].pk}/"})
+        self.assertEqual({twig.depth for twig in twigs}, {3})
+
+    def test_move_with_update_fields_saves_own_path(self):
+        a = self.folder('a')
+        b = self.folder('b')
+        child = self.folder('child', a)
+        grandchild = self.folder('grandchild', child)
+        child.parent = b
+        child.save(update_fields=['parent'])
+        child.refresh_from_db()
+        grandchild.refresh_from_db()
+        self.assertEqual((child.tree_path, child.depth), (f"/{b.pk}/", 1))
+        self.assertEqual((grandchild.tree_path, grandchild.depth), (f"/{b.pk}/{child.pk}/", 2))
+
+    def test_move_into_own_subtree_is_rejected(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        with self.assertRaises(ValueError):
+            root.move_to(child)
+        with self.assertRaises(ValueError):
+            root.move_to(root)
+
+    def test_delete_removes_only_subtree(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        kept = self.folder('kept')
+        other_root = self.folder('root', user=self.other)
+        self.content('inside', child)
+        other_content = self.content('theirs', other_root, user=self.other)
+        root.delete()
+        self.assertFalse(Folder.objects.filter(pk__in=[root.pk, child.pk]).exists())
+        self.assertEqual(set(Folder.objects.all()), {kept, other_root})
+        self.assertEqual(list(Content.objects.all()), [other_content])
+
+    def test_legacy_rows_never_match_other_tenants(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        other_root = self.folder('root', user=self.other)
+        other_content = self.content('theirs', other_root, user=self.other)
+        inside = self.content('inside', child)
+        self.make_legacy(root, child, other_root)
+
+        self.assertEqual(set(root.get_descendants()), {child})
+        self.assertEqual(list(root.subtree_contents()), [inside])
+        self.assertEqual(list(child.get_ancestors()), [root])
+        root.delete()
+        self.assertEqual(list(Folder.objects.all()), [other_root])
+        self.assertEqual(list(Content.objects.all()), [other_content])
+
+    def test_new_folder_under_legacy_parent(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        self.make_legacy(root, child)
+        grandchild = self.folder('grandchild', child)
+        self.assertEqual(grandchild.tree_path, f"/{root.pk}/{child.pk}/")
+        self.assertEqual(grandchild.depth, 2)
+
+    def test_saving_legacy_row_backfills_tree(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        grandchild = self.folder('grandchild', child)
+        self.make_legacy(root, child, grandchild)
+        other = self.folder('other')
+        child.move_to(other)
+        grandchild.refresh_from_db()
+        root.refresh_from_db()
+        self.assertEqual(child.tree_path, f"/{other.pk}/")
+        self.assertEqual(grandchild.tree_path, f"/{other.pk}/{child.pk}/")
+        self.assertEqual(root.tree_path, '/')
+
+    def test_rebuild_tree_paths(self):
+        root = self.folder('root')
+        child = self.folder('child', root)
+        self.make_legacy(root, child)
+        self.assertEqual(Folder.rebuild_tree_paths(user=self.user), 2)
+        child.refresh_from_db()
+        self.assertEqual(child.tree_path, f"/{root.pk}/")
+        self.assertEqual(child.depth, 1)
+        self.assertEqual(Folder.rebuild_tree_paths(user=self.user), 0)
+
+class StoredBlobTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.user = User.objects.create_user(username='teacher', password='secret')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def upload(self, title, data=b'lecture notes', **fields):
+        return Content.objects.create(
+            title=title, content_type='text', file=SimpleUploadedFile('notes.txt', data), user=self.user, **fields
+        )
+
+    def test_identical_uploads_share_a_blob_and_its_text(self):
+        first = self.upload('first', extracted_text='notes')
+        second = self.upload('second')
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(second.extracted_text, 'notes')
+        self.assertEqual(StoredBlob.objects.get().ref_count, 2)
+
+    def test_upload_hash_is_reused(self):
+        upload = SimpleUploadedFile('notes.txt', b'lecture notes')
+        # As set by the hashing upload handlers while the file streamed in
+        upload.sha256 = 'a' * 64
+        with mock.patch('repo.storage.hashlib.sha256') as sha256:
+            content = Content.objects.create(title='notes', content_type='text', file=upload, user=self.user)
+        sha256.assert_not_called()
+        self.assertEqual(content.blob.sha256, 'a' * 64)
+
+    def test_plain_save_does_not_read_the_blob(self):
+        content = Content.objects.get(pk=self.upload('first', extracted_text='notes').pk)
+        content.title = 'renamed'
+        with self.assertNumQueries(1):
+            content.save()
+
+    def test_failed_save_releases_the_reference(self):
+        self.upload('first')
+        with mock.patch('django.db.models.Model.save', side_effect=DatabaseError('boom')):
+            with self.assertRaises(DatabaseError):
+                self.upload('second')
+        self.assertEqual(StoredBlob.objects.get().ref_count, 1)
+
+@mock.patch('repo.relocation.close_old_connections')
+class FileMoveTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        user = User.objects.create_user(username='teacher', password='secret')
+        self.source_name = os.path.join('repository', 'old', 'notes.txt')
+        self.target_name = os.path.join('repository', 'new', 'notes.txt')
+        self.write(self.source_name)
+        self.content = Content.objects.create(title='notes', content_type='text', file=self.source_name, user=user)
+        self.move = FileMove.objects.create(
+            content=self.content, source_name=self.source_name, target_name=self.target_name
+        )
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def write(self, name):
+        os.makedirs(os.path.dirname(self.path(name)), exist_ok=True)
+        with open(self.path(name), 'w') as file:
+            file.write('lecture notes')
+
+    def assert_moved(self):
+        self.content.refresh_from_db()
+        self.move.refresh_from_db()
+        self.assertEqual(self.move.status, 'done')
+        self.assertEqual(self.content.file.name, self.target_name)
+        self.assertFalse(os.path.exists(self.path(self.source_name)))
+        with open(self.content.file.path) as file:
+            self.assertEqual(file.read(), 'lecture notes')
+
+    def test_move(self, close_old_connections):
+        both_readable = []
+        update = QuerySet.update
+
+        def checked_update(queryset, **kwargs):
+            if queryset.model is Content:
+                # Both names must be readable at the moment Content is repointed
+                both_readable.append(all(
+                    os.path.isfile(self.path(name)) for name in (self.source_name, self.target_name)
+                ))
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', checked_update):
+            run_move(self.move.pk)
+        self.assertEqual(both_readable, [True])
+        self.assert_moved()
+
+    def test_retry_after_interrupted_move(self, close_old_connections):
+        # A crash after linking left both names in place
+        self.write(self.target_name)
+        run_move(self.move.pk)
+        self.assert_moved()
+
+    def test_relocating_again_supersedes_pending_move(self, close_old_connections):
+        user = self.content.user
+        first = Folder.objects.create(name='first', folder_path='teacher/first', user=user)
+        second = Folder.objects.create(name='second', folder_path='teacher/second', user=user)
+        contents = Content.objects.filter(pk=self.content.pk)
+        relocate_contents(contents, first)
+        relocate_contents(contents, second)
+        older, newer = FileMove.objects.filter(content=self.content).exclude(pk=self.move.pk).order_by('pk')
+        self.move.refresh_from_db()
+        older.refresh_from_db()
+        self.assertEqual((self.move.status, older.status, newer.status), ('superseded', 'superseded', 'pending'))
+        self.assertEqual(newer.source_name, self.source_name)
+        self.assertTrue(newer.target_name.startswith(os.path.join('repository', 'teacher', 'second')))
+
+        run_move(older.pk)
+        older.refresh_from_db()
+        self.assertEqual(older.status, 'superseded')
+        self.assertFalse(os.path.exists(self.path(older.target_name)))
+        run_move(newer.pk)
+        self.content.refresh_from_db()
+        self.assertEqual(self.content.file.name, newer.target_name)
+        self.assertEqual(resume_moves(), 0)
+
+    def test_move_superseded_while_running_does_not_repoint(self, close_old_connections):
+        def supersede_during_copy(source, target):
+            shutil.copy2(source, target)
+            FileMove.objects.filter(pk=self.move.pk).update(status='superseded')
+
+        with mock.patch('repo.relocation.link_or_copy', supersede_during_copy):
+            run_move(self.move.pk)
+        self.content.refresh_from_db()
+        self.move.refresh_from_db()
+        self.assertEqual(self.move.status, 'superseded')
+        self.assertEqual(self.content.file.name, self.source_name)
+        self.assertTrue(os.path.isfile(self.path(self.source_name)))
+        self.assertFalse(os.path.exists(self.path(self.target_name)))
+
+PAGE = b"<html><head><title>x</title></head><body><h1>Syllabus</h1><p>Week one covers recursion.</p></body></html>"
+PAGE_ETAG = '"v1"'
+
+class PageHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', f"http://localhost:{self.server.server_port}/")
+            self.end_headers()
+        elif self.path == '/bad-status':
+            self.wfile.write(b"NOT HTTP AT ALL\r\n\r\n")
+        elif self.path == '/bogus-charset':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=bogus-xyz')
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+        elif self.headers.get('If-None-Match') == PAGE_ETAG:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('ETag', PAGE_ETAG)
+            self.send_header('Content-Length', str(len(PAGE)))
+            self.end_headers()
+            self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+class LocalServerMixin:
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), PageHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+@override_settings(LINK_FETCH_ALLOWED_HOSTS=['127.0.0.1'])
+class FetchPageTests(LocalServerMixin, SimpleTestCase):
+    def test_fetch_and_revalidate(self):
+        result = fetch_page(self.url)
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['text'], "# Syllabus\n\nWeek one covers recursion.")
+        self.assertEqual(result['etag'], PAGE_ETAG)
+        self.assertEqual(fetch_page(self.url, etag=result['etag']), {'status': 304})
+
+    def test_unknown_charset_falls_back_to_utf8(self):
+        result = fetch_page(self.url + 'bogus-charset')
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['text'], "# Syllabus\n\nWeek one covers recursion.")
+
+    def test_malformed_response_is_a_failure(self):
+        self.assertEqual(fetch_page(self.url + 'bad-status')['status'], 0)
+
+    def test_redirect_to_private_host_is_blocked(self):
+        result = fetch_page(self.url + 'redirect')
+        self.assertEqual(result['status'], 0)
+        self.assertIn('non-public', result['error'])
+
+    @override_settings(LINK_FETCH_ALLOWED_HOSTS=[])
+    def test_private_hosts_are_blocked(self):
+        for url in (self.url, 'http://localhost/', 'http://169.254.169.254/latest/meta-data/', 'http://10.0.0.1/'):
+            result = fetch_page(url)
+            self.assertEqual(result['status'], 0, url)
+            self.assertIn('non-public', result['error'])
+
+    def test_only_http_schemes(self):
+        for url in ('file:///etc/passwd', 'ftp://example.com/', 'data:text/html,hi'):
+            with self.assertRaises(OSError):
+                check_url(url)
+            self.assertEqual(fetch_page(url)['status'], 0)
+
+@override_settings(LINK_FETCH_ALLOWED_HOSTS=['127.0.0.1'], LINK_FETCH_HOST_DELAY=0)
+class RefreshLinksTests(LocalServerMixin, TestCase):
+    def test_refresh_then_not_modified(self):
+        user = User.objects.create_user(username='teacher', password='secret')
+        content = Content.objects.create(title='Syllabus', content_type='link', web_link=self.url, user=user)
+
+        summary = refresh_links(force=True)
+        self.assertEqual((summary['fetched'], summary['changed'], summary['changed_users']), (1, 1, {user.id}))
+        content.refresh_from_db()
+        self.assertEqual(content.extracted_text, "# Syllabus\n\nWeek one covers recursion.")
+        self.assertEqual(content.link_etag, PAGE_ETAG)
+
+        summary = refresh_links(max_age=timedelta(0))
+        self.assertEqual((summary['not_modified'], summary['changed']), (1, 0))
+
+    def test_bad_page_does_not_abort_the_batch(self):
+        user = User.objects.create_user(username='teacher', password='secret')
+        for path in ('', 'bad-status', 'bogus-charset'):
+            Content.objects.create(title=path, content_type='link', web_link=self.url + path, user=user)
+        with mock.patch('repo.link_fetcher.extract_text', side_effect=[RuntimeError('parser bug'), 'ok']):
+            summary = refresh_links(force=True)
+        self.assertEqual((summary['fetched'], summary['failed']), (1, 2))
+        self.assertEqual(Content.objects.filter(extracted_text='ok').count(), 1)
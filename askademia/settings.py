@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+from datetime import timedelta
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -146,4 +147,70 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # LLM API configuration
 LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai')  # Options: openai, gemini, llama
-LLM_API_KEY = os.getenv('LLM_API_KEY', '')
\ No newline at end of file
+LLM_API_KEY = os.getenv('LLM_API_KEY', '')
+LLM_API_BASE = os.getenv('LLM_API_BASE', '')  # Override the OpenAI endpoint, e.g. the local stub server for load tests
+
+# Providers tried in order; later ones are used for hedged requests and failover
+LLM_PROVIDERS = [p.strip() for p in os.getenv('LLM_PROVIDERS', LLM_PROVIDER).split(',') if p.strip()]
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))  # Hedge once the primary is slower than this percentile
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv('LLM_HEDGE_MIN_SAMPLES', 20))
+LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('LLM_CIRCUIT_FAILURE_THRESHOLD', 5))
+LLM_CIRCUIT_RESET_SECONDS = float(os.getenv('LLM_CIRCUIT_RESET_SECONDS', 30))
+LLM_REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', 60))
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', 32))  # Per provider; busier providers are skipped, not queued
+# Embeddings configuration
+# Options: openai, local (offline CPU model). Local is the default when running llama.
+EMBEDDING_PROVIDER = os.getenv('EMBEDDING_PROVIDER', 'local' if LLM_PROVIDER == 'llama' else 'openai')
+OPENAI_EMBEDDING_MODEL = os.getenv('OPENAI_EMBEDDING_MODEL', 'text-embedding-ada-002')
+LOCAL_EMBEDDING_MODEL_PATH = os.getenv('LOCAL_EMBEDDING_MODEL_PATH', os.path.join(BASE_DIR, 'models', 'all-MiniLM-L6-v2'))
+LOCAL_EMBEDDING_MAX_BATCH_SIZE = int(os.getenv('LOCAL_EMBEDDING_MAX_BATCH_SIZE', 64))
+LOCAL_EMBEDDING_MAX_BATCH_CHARS = int(os.getenv('LOCAL_EMBEDDING_MAX_BATCH_CHARS', 32000))
+LOCAL_EMBEDDING_THREADS = int(os.getenv('LOCAL_EMBEDDING_THREADS', os.cpu_count() or 1))
+
+# Coalesce concurrent query embeddings into batched provider calls
+EMBEDDING_BATCH_QUERIES = os.getenv('EMBEDDING_BATCH_QUERIES', 'True') == 'True'
+EMBEDDING_BATCH_MAX_WAIT_MS = float(os.getenv('EMBEDDING_BATCH_MAX_WAIT_MS', 10))
+EMBEDDING_BATCH_MAX_SIZE = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', 32))
+
+# Background file moves for bulk content relocation
+FILE_MOVE_WORKERS = int(os.getenv('FILE_MOVE_WORKERS', 4))
+FILE_MOVE_MAX_ATTEMPTS = int(os.getenv('FILE_MOVE_MAX_ATTEMPTS', 5))
+
+# Hash uploads while they stream in so identical files are stored once
+FILE_UPLOAD_HANDLERS = [
+    'repo.storage.HashingMemoryFileUploadHandler',
+    'repo.storage.HashingTemporaryFileUploadHandler',
+]
+
+# Previous index snapshots kept for readers still on them after a rebuild
+VECTOR_STORE_KEEP_SNAPSHOTS = int(os.getenv('VECTOR_STORE_KEEP_SNAPSHOTS', 2))
+
+# Most recently used user indexes each worker keeps loaded between requests
+LOADED_INDEX_CACHE_SIZE = int(os.getenv('LOADED_INDEX_CACHE_SIZE', 16))
+
+# Seconds a request waits for another worker's index build before answering "warming up"
+INDEX_BUILD_LOCK_TIMEOUT = float(os.getenv('INDEX_BUILD_LOCK_TIMEOUT', 30))
+
+# Chunking per Content.content_type ('default' covers anything not listed).
+# Chunkers: structured (heading/paragraph aware), whole (short texts kept intact), recursive (legacy).
+CHUNKING = {
+    'default': {'chunker': 'structured', 'chunk_size': 1000, 'chunk_overlap': 200},
+    'text': {'chunker': 'structured', 'chunk_size': 1000, 'chunk_overlap': 200},
+    'pdf': {'chunker': 'structured', 'chunk_size': 1000, 'chunk_overlap': 200},
+    'link': {'chunker': 'whole', 'max_size': 2000},
+    'image': {'chunker': 'whole', 'max_size': 2000},
+    'video': {'chunker': 'whole', 'max_size': 2000},
+}
+
+# How long the per-user content id -> title/folder table used at query time is cached
+CONTENT_LOOKUP_CACHE_SECONDS = int(os.getenv('CONTENT_LOOKUP_CACHE_SECONDS', 60))
+
+# Fetching the pages behind web-link content
+LINK_FETCH_CONCURRENCY = int(os.getenv('LINK_FETCH_CONCURRENCY', 8))
+LINK_FETCH_HOST_DELAY = float(os.getenv('LINK_FETCH_HOST_DELAY', 1.0))  # Seconds between requests to one host
+LINK_FETCH_TIMEOUT = float(os.getenv('LINK_FETCH_TIMEOUT', 15))
+LINK_FETCH_MAX_BYTES = int(os.getenv('LINK_FETCH_MAX_BYTES', 5 * 1024 * 1024))
+LINK_FETCH_USER_AGENT = os.getenv('LINK_FETCH_USER_AGENT', 'AskademiaBot/1.0')
+# Hosts (names or IPs) fetched even though they resolve to private or loopback addresses, e.g. a local test server
+LINK_FETCH_ALLOWED_HOSTS = [h.strip().lower() for h in os.getenv('LINK_FETCH_ALLOWED_HOSTS', '').split(',') if h.strip()]
+LINK_REFRESH_MAX_AGE = timedelta(hours=float(os.getenv('LINK_REFRESH_MAX_AGE_HOURS', 24)))